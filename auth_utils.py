@@ -1,28 +1,73 @@
 import streamlit as st
 import hashlib
+import hmac
+import os
+from db.init import ensure_database
+
+# Session keys the sidebar (and the pages behind it) expect to exist.
+_SIDEBAR_DEFAULTS = {'authenticated': False, 'user': None, 'selected_ticket_id': None}
+
+# PBKDF2-HMAC-SHA256 parameters for stored password hashes.
+PASSWORD_HASH_ITERATIONS = 100_000
+PASSWORD_SALT_BYTES = 16
+
+def hash_password(password):
+    """Returns a salted PBKDF2 hash of `password`, stored as '<salt hex>$<hash hex>'."""
+    salt = os.urandom(PASSWORD_SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, PASSWORD_HASH_ITERATIONS)
+    return f"{salt.hex()}${digest.hex()}"
+
+def is_legacy_hash(hashed_password):
+    """True for unsalted SHA-256 hex digests stored before hash_password existed."""
+    return '$' not in hashed_password
 
 def verify_password(plain_password, hashed_password):
-    return hashlib.sha256(plain_password.encode()).hexdigest() == hashed_password 
+    """
+    Checks a password against its stored hash in constant time.
+    Accepts both salted PBKDF2 hashes and legacy unsalted SHA-256 hex digests.
+    """
+    try:
+        if is_legacy_hash(hashed_password):
+            expected = bytes.fromhex(hashed_password)
+            digest = hashlib.sha256(plain_password.encode()).digest()
+        else:
+            salt_hex, hash_hex = hashed_password.split('$', 1)
+            expected = bytes.fromhex(hash_hex)
+            digest = hashlib.pbkdf2_hmac(
+                'sha256', plain_password.encode(), bytes.fromhex(salt_hex),
+                PASSWORD_HASH_ITERATIONS
+            )
+    except (TypeError, ValueError):
+        return False
+    return hmac.compare_digest(digest, expected)
+
+@st.cache_resource(show_spinner=False)
+def ensure_database_ready():
+    """Applies pending schema migrations (db/init.py) once per server process."""
+    ensure_database()
 
 def render_sidebar():
     """Renders the sidebar with navigation links based on authentication status."""
+    # Every page renders the sidebar before touching the database, so this
+    # is where the app brings the schema up to date on startup.
+    ensure_database_ready()
+
     st.sidebar.title("Navigation")
 
     # Ensure session state keys exist
-    if 'authenticated' not in st.session_state:
-        st.session_state['authenticated'] = False
-    if 'user' not in st.session_state:
-        st.session_state['user'] = None
+    for key, value in _SIDEBAR_DEFAULTS.items():
+        st.session_state.setdefault(key, value)
 
-    if st.session_state.get('authenticated'):
-        st.sidebar.success(f"Logged in as {st.session_state['user']['username']}")
+    user = st.session_state['user']
+    if st.session_state['authenticated']:
+        st.sidebar.success(f"Logged in as {user['username']}")
         
         st.sidebar.page_link("app.py", label="Home", icon="🏠")
         st.sidebar.page_link("pages/3_Dashboard.py", label="Dashboard", icon="📊")
         st.sidebar.page_link("pages/4_Tickets.py", label="Tickets", icon="🎫")
         st.sidebar.page_link("pages/5_Create_Ticket.py", label="Create Ticket", icon="📝")
         st.sidebar.page_link("pages/8_Profile.py", label="Profile", icon="👤")
-        if st.session_state.get('user')['role'] == 'admin':
+        if user.get('role') == 'admin':
             st.sidebar.page_link("pages/_Admin.py", label="Admin Panel", icon="🛠️")
             st.sidebar.page_link("pages/_Reports.py", label="Reports", icon="📈")
         
@@ -1,103 +1,185 @@
+import atexit
+import queue
 import sqlite3
-import pandas as pd
-from .database import get_db_connection
+import threading
+import time
+from functools import lru_cache
+from .pool import pooled_connection, read_dataframe
 
 # --- Activity Log ---
-def log_activity(user_id, action_type, resource_type=None, resource_id=None, details=""):
-    conn = get_db_connection()
+# Log entries are queued and written in batches by a background thread, so a
+# mutation pays for a queue put instead of an INSERT + commit per event.
+# Queued entries are written at exit, but a killed or crashed process loses
+# up to LOG_FLUSH_INTERVAL_SECONDS of them; admin actions log with
+# durable=True so they are written before the call returns.
+LOG_BATCH_SIZE = 500
+LOG_FLUSH_INTERVAL_SECONDS = 0.5
+
+_INSERT_ACTIVITY_LOG = (
+    "INSERT INTO activity_logs (user_id, action_type, resource_type, resource_id, details, timestamp) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+_log_queue = queue.Queue()
+
+def log_activity(user_id, action_type, resource_type=None, resource_id=None, details="", durable=False):
+    """
+    Queues an activity log entry for the background writer.
+    With `durable`, the entry (and everything queued before it) is written
+    before returning, for audit-relevant actions.
+    """
+    # Same format as the column's CURRENT_TIMESTAMP default (UTC).
+    timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+    _log_queue.put((user_id, action_type, resource_type, resource_id, details, timestamp))
+    if durable:
+        flush_activity_logs()
+
+def _write_log_batch(rows):
     try:
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO activity_logs (user_id, action_type, resource_type, resource_id, details) VALUES (?, ?, ?, ?, ?)",
-            (user_id, action_type, resource_type, resource_id, details)
-        )
-        conn.commit()
+        with pooled_connection() as conn:
+            try:
+                conn.executemany(_INSERT_ACTIVITY_LOG, rows)
+                conn.commit()
+            except Exception as e:
+                conn.rollback() # Don't leave a transaction open on the pooled connection
+                # Fall back to row-by-row so one bad entry doesn't drop the whole batch
+                for row in rows:
+                    try:
+                        conn.execute(_INSERT_ACTIVITY_LOG, row)
+                        conn.commit()
+                    except Exception as e:
+                        conn.rollback()
+                        print(f"Failed to log activity: {e}") # Don't crash app if logging fails
     except Exception as e:
-        print(f"Failed to log activity: {e}") # Don't crash app if logging fails
+        print(f"Failed to log activity: {e}")
     finally:
-        conn.close()
+        for _ in rows:
+            _log_queue.task_done()
+
+def _log_writer():
+    while True:
+        rows = [_log_queue.get()]
+        deadline = time.monotonic() + LOG_FLUSH_INTERVAL_SECONDS
+        while len(rows) < LOG_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                rows.append(_log_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        _write_log_batch(rows)
 
-def get_activity_logs(start_date=None, end_date=None, user_id=None, action_type=None, limit=50, offset=0):
+def flush_activity_logs():
+    """Writes all queued activity log entries and waits for in-flight batches."""
+    while True:
+        rows = []
+        while len(rows) < LOG_BATCH_SIZE:
+            try:
+                rows.append(_log_queue.get_nowait())
+            except queue.Empty:
+                break
+        if not rows:
+            break
+        _write_log_batch(rows)
+    _log_queue.join()
+
+threading.Thread(target=_log_writer, name="activity-log-writer", daemon=True).start()
+atexit.register(flush_activity_logs)
+
+# Filter name -> condition, in the order parameters are bound. Compare the
+# raw timestamp (not DATE(timestamp)) so idx_logs_ts is usable.
+_ACTIVITY_LOG_FILTERS = (
+    ('start_date', "a.timestamp >= ?"),
+    ('end_date', "a.timestamp < DATE(?, '+1 day')"),
+    ('user_id', "a.user_id = ?"),
+    ('action_type', "a.action_type = ?"),
+)
+
+@lru_cache(maxsize=None)
+def _activity_log_queries(filter_keys, keyset, paginated):
+    """
+    (count_query, data_query) for one get_activity_logs shape, built once
+    per shape so repeat calls reuse the same statement text.
+    """
+    conditions = [condition for key, condition in _ACTIVITY_LOG_FILTERS if key in filter_keys]
+    where_clause = " WHERE " + " AND ".join(conditions) if conditions else ""
+
+    # For getting total count (for pagination info). None of the filters touch
+    # `users`, so the count skips the join and the sort entirely.
+    count_query = "SELECT COUNT(*) FROM activity_logs a" + where_clause
+
+    # Seeking past the previous page's last row walks idx_logs_ts from that
+    # point, instead of scanning and discarding `offset` rows.
+    if keyset:
+        where_clause += (" AND " if where_clause else " WHERE ") + "(a.timestamp, a.id) < (?, ?)"
+
+    data_query = """
+    SELECT a.*, u.username
+    FROM activity_logs a
+    LEFT JOIN users u ON a.user_id = u.id
+    """ + where_clause + " ORDER BY a.timestamp DESC, a.id DESC"
+    if paginated:
+        data_query += " LIMIT ? OFFSET ?"
+    return count_query, data_query
+
+def get_activity_logs(start_date=None, end_date=None, user_id=None, action_type=None, limit=50, offset=0, before=None):
     """
     Retrieves activity logs with optional filtering and pagination.
     - start_date, end_date: filter by timestamp range (YYYY-MM-DD).
     - user_id: filter by a specific user.
     - action_type: filter by a specific action type.
     - limit, offset: for pagination.
+    - before: (timestamp, id) of the last row of the previous page. When given,
+      the page starts right after that row (keyset pagination) and offset is ignored.
     Returns a DataFrame and the total count of filtered logs.
     """
-    conn = get_db_connection()
-    conditions = []
-    params = []
+    flush_activity_logs() # Make queued entries visible to the reader
 
-    query_base = """
-    SELECT a.*, u.username
-    FROM activity_logs a
-    LEFT JOIN users u ON a.user_id = u.id
-    """
+    filter_values = {
+        'start_date': start_date, 'end_date': end_date,
+        'user_id': user_id, 'action_type': action_type,
+    }
+    filter_keys = tuple(key for key, _ in _ACTIVITY_LOG_FILTERS if filter_values[key])
+    params = [filter_values[key] for key in filter_keys]
+    # A keyset page starts at offset 0 of the rows after `before`.
+    if before is not None:
+        offset = 0
+    paginated = limit is not None and offset is not None
+    count_query, data_query = _activity_log_queries(filter_keys, before is not None, paginated)
 
-    if start_date:
-        conditions.append("DATE(a.timestamp) >= ?")
-        params.append(start_date)
-    if end_date:
-        conditions.append("DATE(a.timestamp) <= ?")
-        params.append(end_date)
-    if user_id:
-        conditions.append("a.user_id = ?")
-        params.append(user_id)
-    if action_type:
-        conditions.append("a.action_type = ?")
-        params.append(action_type)
-
-    if conditions:
-        query_base += " WHERE " + " AND ".join(conditions)
-
-    query_base += " ORDER BY a.timestamp DESC"
-
-    # Parameters for filtering only (used for count_query)
-    filter_params = list(params) # Create a copy for the count query
-
-    # For getting total count (for pagination info)
-    count_query = "SELECT COUNT(*) FROM (" + query_base + ") AS sub"
-    total_count_df = pd.read_sql_query(count_query, conn, params=filter_params)
-    total_count = total_count_df.iloc[0, 0] if not total_count_df.empty else 0
-
-    # Parameters for data retrieval (filters + limit/offset)
+    # Parameters for data retrieval (filters + keyset/limit/offset)
     data_params = list(params) # Create a new list, starting with filter params
-    
-    data_query = query_base
-    if limit is not None and offset is not None:
-        data_query += " LIMIT ? OFFSET ?"
+    if before is not None:
+        data_params.extend(before)
+    if paginated:
         data_params.extend([limit, offset])
 
-    df = pd.read_sql_query(data_query, conn, params=data_params)
-    conn.close()
+    with pooled_connection() as conn:
+        total_count = conn.execute(count_query, params).fetchone()[0]
+        df = read_dataframe(conn, data_query, data_params)
     return df, total_count
 
 def get_distinct_activity_users():
     """Retrieves distinct user IDs and usernames from activity logs."""
-    conn = get_db_connection()
-    try:
-        query = """
-            SELECT DISTINCT a.user_id, u.username
-            FROM activity_logs a
-            JOIN users u ON a.user_id = u.id
-            WHERE a.user_id IS NOT NULL
-            ORDER BY u.username
-        """
+    flush_activity_logs()
+    query = """
+        SELECT DISTINCT a.user_id, u.username
+        FROM activity_logs a
+        JOIN users u ON a.user_id = u.id
+        WHERE a.user_id IS NOT NULL
+        ORDER BY u.username
+    """
+    with pooled_connection() as conn:
         cursor = conn.cursor()
         cursor.execute(query)
         return [dict(row) for row in cursor.fetchall()]
-    finally:
-        conn.close()
 
 def get_distinct_action_types():
     """Retrieves distinct action types from activity logs."""
-    conn = get_db_connection()
-    try:
-        query = "SELECT DISTINCT action_type FROM activity_logs ORDER BY action_type"
+    flush_activity_logs()
+    query = "SELECT DISTINCT action_type FROM activity_logs ORDER BY action_type"
+    with pooled_connection() as conn:
         cursor = conn.cursor()
         cursor.execute(query)
         return [row['action_type'] for row in cursor.fetchall()]
-    finally:
-        conn.close()
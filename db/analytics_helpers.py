@@ -4,38 +4,392 @@ Returns data ready for visualization with Plotly and Altair.
 """
 
 import sqlite3
+import numpy as np
 import pandas as pd
-from datetime import datetime
-from db.users import get_user
+from datetime import datetime, timezone
+from db.pool import pooled_connection
+from db.materialized import ROLLUP_TABLE, NULL_KEY, Q_ROLLUP_VERSION
+from db.users import get_user_role
 import re
+import json
 from collections import Counter
-import streamlit as st
+from functools import lru_cache
 
-DATABASE_NAME = "suppocket.db"
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
 
+# Ticket statuses that count as resolved / still open.
+RESOLVED_STATUSES = ('Resolved', 'Closed')
+OPEN_STATUSES = ('Open', 'In Progress')
 
-def get_db_connection():
-    """Establishes a connection to the SQLite database."""
-    conn = sqlite3.connect(DATABASE_NAME, detect_types=sqlite3.PARSE_DECLTYPES)
-    conn.row_factory = sqlite3.Row
-    return conn
+# List of common English stop words (can be expanded)
+STOP_WORDS = frozenset([
+    "a", "an", "the", "and", "but", "or", "for", "nor", "on", "at", "to",
+    "from", "by", "with", "about", "as", "is", "was", "were", "be",
+    "been", "being", "have", "has", "had", "do", "does", "did", "not",
+    "no", "don", "t", "s", "m", "ll", "ve", "re", "just", "can", "will",
+    "would", "should", "could", "get", "go", "make", "know", "see",
+    "take", "come", "think", "look", "want", "give", "use", "find",
+    "tell", "ask", "work", "seem", "feel", "try", "leave", "call", "good",
+    "new", "first", "last", "long", "great", "little", "own", "other",
+    "old", "right", "big", "high", "different", "small", "large", "next",
+    "early", "important", "few", "public", "bad", "same", "able", "back",
+    "any", "each", "every", "many", "much", "some", "such", "up", "down",
+    "out", "in", "off", "over", "under", "again", "further", "then",
+    "once", "here", "there", "when", "where", "why", "how", "all", "both",
+    "more", "mocouldst", "only", "so", "than", "too", "very", "don't",
+    "shouldn't", "now", "i", "me", "my", "myself", "we", "our", "ours",
+    "ourselves", "you", "your", "yours", "yourself", "yourselves", "he",
+    "him", "his", "himself", "she", "her", "hers", "herself", "it", "its",
+    "itself", "they", "them", "their", "theirs", "themselves", "what",
+    "which", "who", "whom", "this", "that", "these", "those", "am", "are",
+    "having", "doing", "said", "into", "through", "during", "before",
+    "after", "above", "below", "most", "id", "im", "youre", "dont",
+    "cant", "wouldnt", "nt", "shoudnt", "mustnt", "like", "one", "two",
+    "three", "four", "five", "six", "seven", "eight", "nine", "ten",
+    "day", "week", "month", "year", "issue", "problem", "report",
+    "request", "ticket", "service", "support"
+])
+
+# Low-cardinality labels stored as categoricals, and id/count columns
+# that always fit in 32 bits, in frames returned by _execute_query.
+CATEGORICAL_COLUMNS = ('status', 'priority', 'category')
+INT32_COLUMNS = ('id', 'count', 'created', 'resolved')
+
+# Words shorter than three letters are never keywords.
+KEYWORD_PATTERN = re.compile(r'[a-z]{3,}')
+
+# Fixed SQL text lets the connection's statement cache reuse the prepared
+# statement instead of re-parsing the query on every call.
+# Unscoped aggregates read the daily roll-up (db/materialized.py); buckets
+# can drop to zero after updates, hence the HAVING clauses. Its NULL_KEY
+# placeholder is mapped back to NULL.
+Q_COUNTS_BY_CATEGORY = f"""
+    SELECT NULLIF(category, {NULL_KEY}) as category, SUM(created_count) as count
+    FROM {ROLLUP_TABLE}
+    WHERE day >= ? AND day < DATE(?, '+1 day')
+    GROUP BY category
+    HAVING count > 0
+    ORDER BY
+        count DESC
+"""
+Q_TOP_CATEGORIES = Q_COUNTS_BY_CATEGORY + " LIMIT ?"
+
+Q_COUNTS_BY_PRIORITY = f"""
+    SELECT NULLIF(priority, {NULL_KEY}) as priority, SUM(created_count) as count
+    FROM {ROLLUP_TABLE}
+    WHERE day >= ? AND day < DATE(?, '+1 day')
+    GROUP BY priority
+    HAVING count > 0
+    ORDER BY MIN(priority_rank)
+"""
+
+_Q_TRENDS_TEMPLATE = f"""
+    SELECT STRFTIME('{{date_format}}', day) as date,
+    SUM(created_count) as count
+    FROM {ROLLUP_TABLE}
+    WHERE day >= ? AND day < DATE(?, '+1 day')
+    GROUP BY date
+    HAVING count > 0
+    ORDER BY
+        date ASC
+"""
+GROUP_FORMATS = {
+    'daily': '%Y-%m-%d',
+    'weekly': '%Y-%W',
+    'monthly': '%Y-%m'
+}
+
+# pandas period aliases for the same groupings, used on DataFrame input.
+TREND_PERIODS = {
+    'daily': 'D',
+    'weekly': 'W',
+    'monthly': 'M'
+}
+
+Q_TRENDS = {
+    grouping: _Q_TRENDS_TEMPLATE.format(date_format=date_format)
+    for grouping, date_format in GROUP_FORMATS.items()
+}
+
+# Created and resolved events are stacked with UNION ALL and summed per date
+# bucket in one query. Keyed by (grouping, ticket column the user filters on).
+_Q_CREATED_VS_RESOLVED_TEMPLATE = """
+    SELECT date, SUM(is_created) as created, SUM(is_resolved) as resolved
+    FROM (
+        SELECT STRFTIME('{date_format}', created_at) as date, 1 as is_created, 0 as is_resolved
+        FROM tickets
+        WHERE created_at >= ? AND created_at < DATE(?, '+1 day') {user_filter}
+        UNION ALL
+        SELECT STRFTIME('{date_format}', resolved_at) as date, 0, 1
+        FROM tickets
+        WHERE resolved_at IS NOT NULL
+          AND resolved_at >= ? AND resolved_at < DATE(?, '+1 day') {user_filter}
+    )
+    GROUP BY date
+    ORDER BY date
+"""
+_Q_CREATED_VS_RESOLVED_ROLLUP_TEMPLATE = f"""
+    SELECT STRFTIME('{{date_format}}', day) as date,
+        SUM(created_count) as created, SUM(resolved_count) as resolved
+    FROM {ROLLUP_TABLE}
+    WHERE day >= ? AND day < DATE(?, '+1 day')
+    GROUP BY date
+    HAVING created > 0 OR resolved > 0
+    ORDER BY date
+"""
+Q_CREATED_VS_RESOLVED = {
+    (grouping, user_column): _Q_CREATED_VS_RESOLVED_TEMPLATE.format(
+        date_format=date_format,
+        user_filter=f"AND {user_column} = ?"
+    )
+    for grouping, date_format in GROUP_FORMATS.items()
+    for user_column in ('customer_id', 'agent_id')
+}
+Q_CREATED_VS_RESOLVED.update({
+    (grouping, None): _Q_CREATED_VS_RESOLVED_ROLLUP_TEMPLATE.format(
+        date_format=date_format
+    )
+    for grouping, date_format in GROUP_FORMATS.items()
+})
+
+# Ticket column that scopes results for each non-admin role.
+ROLE_SCOPE_COLUMNS = {'customer': 'customer_id', 'agent': 'agent_id'}
+
+_Q_RESOLUTION_TIME_TEMPLATE = """
+    SELECT {group_column}, AVG((JULIANDAY(resolved_at) - JULIANDAY(created_at)) * 24.0)
+        as avg_resolution_hours
+    FROM tickets
+    WHERE status IN ('Resolved', 'Closed') AND resolved_at IS NOT NULL
+      AND resolved_at >= ? AND resolved_at < DATE(?, '+1 day') {user_filter}
+    GROUP BY {group_column}
+    ORDER BY avg_resolution_hours DESC
+"""
+_Q_RESOLUTION_TIME_ROLLUP_TEMPLATE = f"""
+    SELECT NULLIF({{group_column}}, {NULL_KEY}) as {{group_column}},
+        SUM(sum_resolution_hours) / SUM(n_resolved) as avg_resolution_hours
+    FROM {ROLLUP_TABLE}
+    WHERE day >= ? AND day < DATE(?, '+1 day')
+    GROUP BY {{group_column}}
+    HAVING SUM(n_resolved) > 0
+    ORDER BY avg_resolution_hours DESC
+"""
+# Keyed by (grouping column, ticket column the user filters on).
+Q_RESOLUTION_TIME = {
+    (group_column, user_column): _Q_RESOLUTION_TIME_TEMPLATE.format(
+        group_column=group_column,
+        user_filter=f"AND {user_column} = ?"
+    )
+    for group_column in ('category', 'priority')
+    for user_column in ('customer_id', 'agent_id')
+}
+Q_RESOLUTION_TIME.update({
+    (group_column, None): _Q_RESOLUTION_TIME_ROLLUP_TEMPLATE.format(
+        group_column=group_column
+    )
+    for group_column in ('category', 'priority')
+})
+
+Q_AVERAGE_RESOLUTION_TIME = f"""
+    SELECT SUM(sum_resolution_hours) / SUM(n_resolved)
+    FROM {ROLLUP_TABLE}
+    WHERE day >= ? AND day < DATE(?, '+1 day')
+"""
+
+# Unscoped equivalents on the tickets table, used while the roll-up does
+# not exist (it is created with the schema migrations, see db/init.py).
+Q_ROLLUP_EXISTS = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?"
+
+Q_COUNTS_BY_CATEGORY_TICKETS = """
+    SELECT category, COUNT(id) as count
+    FROM tickets
+    WHERE created_at >= ? AND created_at < DATE(?, '+1 day')
+    GROUP BY category
+    ORDER BY
+        count DESC
+"""
+Q_TOP_CATEGORIES_TICKETS = Q_COUNTS_BY_CATEGORY_TICKETS + " LIMIT ?"
+
+Q_COUNTS_BY_PRIORITY_TICKETS = """
+    SELECT priority, COUNT(id) as count
+    FROM tickets
+    WHERE created_at >= ? AND created_at < DATE(?, '+1 day')
+    GROUP BY priority
+    ORDER BY MIN(priority_rank)
+"""
+
+Q_TRENDS_TICKETS = {
+    grouping: f"""
+    SELECT STRFTIME('{date_format}', created_at) as date,
+    COUNT(id) as count
+    FROM tickets
+    WHERE created_at >= ? AND created_at < DATE(?, '+1 day')
+    GROUP BY date
+    ORDER BY
+        date ASC
+"""
+    for grouping, date_format in GROUP_FORMATS.items()
+}
+
+Q_CREATED_VS_RESOLVED_TICKETS = {
+    grouping: _Q_CREATED_VS_RESOLVED_TEMPLATE.format(
+        date_format=date_format, user_filter=""
+    )
+    for grouping, date_format in GROUP_FORMATS.items()
+}
+
+Q_RESOLUTION_TIME_TICKETS = {
+    group_column: _Q_RESOLUTION_TIME_TEMPLATE.format(
+        group_column=group_column, user_filter=""
+    )
+    for group_column in ('category', 'priority')
+}
+
+Q_AVERAGE_RESOLUTION_TIME_TICKETS = """
+    SELECT AVG((JULIANDAY(resolved_at) - JULIANDAY(created_at)) * 24.0)
+    FROM tickets
+    WHERE status IN ('Resolved', 'Closed')
+      AND resolved_at IS NOT NULL
+      AND resolved_at >= ? AND resolved_at < DATE(?, '+1 day')
+"""
+
+# AVG skips unresolved tickets, whose JULIANDAY difference is NULL.
+_Q_AGENT_PERFORMANCE_TEMPLATE = """
+    SELECT u.username as agent_name, COUNT(*) as tickets_assigned,
+        SUM(t.status IN ('Resolved', 'Closed')) as tickets_resolved,
+        AVG((JULIANDAY(t.resolved_at) - JULIANDAY(t.created_at)) * 24.0)
+            as avg_resolution_time_hours
+    FROM tickets t JOIN users u ON t.agent_id = u.id
+    WHERE t.agent_id IS NOT NULL
+      AND t.created_at >= ? AND t.created_at < DATE(?, '+1 day') {user_filter}
+    GROUP BY u.username
+    ORDER BY u.username
+"""
+Q_AGENT_PERFORMANCE = {
+    user_column: _Q_AGENT_PERFORMANCE_TEMPLATE.format(
+        user_filter=f"AND t.{user_column} = ?" if user_column else ""
+    )
+    for user_column in (None, 'agent_id')
+}
+
+# Ticket columns the analytics and report pages read or export. Spelled out
+# so internal columns (priority_rank) stay out of the frames and exports;
+# title and description feed the keyword analysis and the exports.
+TICKET_ANALYTICS_COLUMNS = (
+    'id', 'title', 'description', 'category', 'priority', 'status',
+    'customer_id', 'agent_id', 'created_at', 'updated_at', 'resolved_at'
+)
+
+_Q_TICKETS_FOR_ANALYTICS_TEMPLATE = f"""
+    SELECT {', '.join(TICKET_ANALYTICS_COLUMNS)} FROM tickets
+    WHERE created_at >= ? AND created_at < DATE(?, '+1 day') {{user_filter}}
+"""
+Q_TICKETS_FOR_ANALYTICS = {
+    user_column: _Q_TICKETS_FOR_ANALYTICS_TEMPLATE.format(
+        user_filter=f"AND {user_column} = ?" if user_column else ""
+    )
+    for user_column in (None, 'customer_id', 'agent_id')
+}
+
+# Optional filters arrive as JSON arrays (NULL means "any") so the SQL text
+# stays fixed whatever the number of selected values. A JSON null in the
+# array selects rows where the column IS NULL (IN never matches NULL).
+_Q_STATUS_BREAKDOWN_TEMPLATE = """
+    SELECT category, status, COUNT(*) as count
+    FROM tickets
+    WHERE created_at >= ?1 AND created_at < DATE(?2, '+1 day') {user_filter}
+      AND (?3 IS NULL OR category IN (SELECT value FROM json_each(?3))
+           OR (category IS NULL AND EXISTS (SELECT 1 FROM json_each(?3) WHERE type = 'null')))
+      AND (?4 IS NULL OR priority IN (SELECT value FROM json_each(?4))
+           OR (priority IS NULL AND EXISTS (SELECT 1 FROM json_each(?4) WHERE type = 'null')))
+      AND (?5 IS NULL OR status IN (SELECT value FROM json_each(?5)))
+    GROUP BY category, status
+    ORDER BY category, status
+"""
+Q_STATUS_BREAKDOWN = {
+    user_column: _Q_STATUS_BREAKDOWN_TEMPLATE.format(
+        user_filter=f"AND {user_column} = ?6" if user_column else ""
+    )
+    for user_column in (None, 'customer_id', 'agent_id')
+}
+
+def _analytics_connection():
+    """
+    Checks out a pooled connection that parses TIMESTAMP columns into
+    datetimes (PARSE_DECLTYPES), for use in a `with` block.
+    """
+    return pooled_connection(detect_types=sqlite3.PARSE_DECLTYPES)
+
+
+def _execute_rows(query: str, params: tuple = ()) -> tuple:
+    """
+    Executes a SQL query and returns (column_names, rows) without pandas.
+    """
+    with _analytics_connection() as conn:
+        cursor = conn.execute(query, params)
+        columns = [description[0] for description in cursor.description]
+        return columns, cursor.fetchall()
+
+
+# Frames are kept by reference; _execute_query hands callers a copy they
+# may mutate.
+@lru_cache(maxsize=32)
+def _cached_read_sql(
+    query: str, params: tuple, parse_dates: tuple, version
+) -> pd.DataFrame:
+    """
+    Runs a read-only query and caches the resulting DataFrame.
+    The cache key is (query, params) plus the data version, so repeated
+    reruns are served from memory until the tickets change.
+    TIMESTAMP columns already arrive as datetime objects (PARSE_DECLTYPES),
+    so the `parse_dates` columns only need one vectorised cast.
+    """
+    columns, rows = _execute_rows(query, params)
+    df = pd.DataFrame.from_records(rows, columns=columns)
+    for column in parse_dates or ():
+        if column in df.columns:
+            df[column] = df[column].astype('datetime64[ns]')
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    for column in INT32_COLUMNS:
+        if column in df.columns and pd.api.types.is_integer_dtype(df[column]):
+            df[column] = df[column].astype('int32')
+    return _with_arrow_strings(df)
+
+
+def _with_arrow_strings(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Stores text columns as Arrow strings so Streamlit can hand them to the
+    frontend without re-encoding each cell. Returns `df` unchanged when
+    pyarrow is not installed.
+    """
+    if pa is None:
+        return df
+    for column in df.columns:
+        values = df[column]
+        if (values.dtype == object or pd.api.types.is_string_dtype(values)) and \
+                pd.api.types.infer_dtype(values, skipna=True) == 'string':
+            df[column] = values.astype(pd.ArrowDtype(pa.string()))
+    return df
 
 
 def _execute_query(
-    query: str, params: tuple = ()
+    query: str, params: tuple = (), parse_dates: list = None
 ) -> pd.DataFrame:
     """
     Executes a SQL query and returns the result as a pandas DataFrame.
-    Includes error handling and ensures the connection is closed.
+    Only the columns named in `parse_dates` are converted to datetimes.
+    Includes error handling. Results are cached per (query, params) until
+    the data version changes; errors are not cached.
     """
     try:
-        conn = get_db_connection()
-        df = pd.read_sql_query(
-            query, conn, params=params,
-            parse_dates=['created_at', 'resolved_at', 'updated_at']
+        return _versioned(
+            _cached_read_sql,
+            query, tuple(params), tuple(parse_dates) if parse_dates else None
         )
-        conn.close()
-        return df
     except sqlite3.Error as e:
         print(f"Database error: {e}")
         return pd.DataFrame()
@@ -44,6 +398,61 @@ def _execute_query(
         return pd.DataFrame()
 
 
+def _execute_df_small(query: str, params: tuple = ()) -> pd.DataFrame:
+    """
+    Executes a query expected to return only a handful of rows.
+    Builds the DataFrame with from_records, skipping read_sql_query's
+    per-call dtype inference, which dominates for tiny results.
+    """
+    try:
+        columns, rows = _execute_rows(query, params)
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        return pd.DataFrame()
+    return pd.DataFrame.from_records(rows, columns=columns)
+
+
+def _execute_scalar(query: str, params: tuple = ()):
+    """
+    Executes a SQL query that yields a single value and returns it.
+    Returns None on error, mirroring _execute_query's error handling.
+    """
+    try:
+        with _analytics_connection() as conn:
+            row = conn.execute(query, params).fetchone()
+        return row[0] if row else None
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        return None
+
+
+def _ensure_dt(df: pd.DataFrame, columns) -> pd.DataFrame:
+    """
+    Returns `df` with `columns` as datetimes, converting only the ones that
+    are not datetime64 already. The caller's frame is never modified.
+    """
+    converted = {
+        column: pd.to_datetime(df[column]) for column in columns
+        if not pd.api.types.is_datetime64_any_dtype(df[column])
+    }
+    return df.assign(**converted) if converted else df
+
+
+NS_PER_DAY = 86_400 * 10**9
+
+
+def _hours_between(start: pd.Series, end: pd.Series) -> np.ndarray:
+    """
+    Returns the hours from `start` to `end` for each row, computed on the
+    int64 nanosecond views. Rows where either side is missing are NaN.
+    """
+    start_ns = start.to_numpy(dtype='datetime64[ns]')
+    end_ns = end.to_numpy(dtype='datetime64[ns]')
+    hours = (end_ns.view('i8') - start_ns.view('i8')) / 3.6e12
+    hours[np.isnat(start_ns) | np.isnat(end_ns)] = np.nan
+    return hours
+
+
 def calculate_average_resolution_time(
     df: pd.DataFrame = None, start_date: str = None, end_date: str = None
 ) -> float:
@@ -55,59 +464,111 @@ def calculate_average_resolution_time(
     if df is None:
         if not start_date or not end_date:
             return 0.0
-        query = """
-            SELECT created_at, resolved_at
-            FROM tickets
-            WHERE status IN ('Resolved', 'Closed')
-              AND resolved_at IS NOT NULL
-              AND resolved_at BETWEEN ? AND ?
-        """
-        df = _execute_query(query, (start_date, end_date))
+        query = Q_AVERAGE_RESOLUTION_TIME if _has_rollup() \
+            else Q_AVERAGE_RESOLUTION_TIME_TICKETS
+        return _execute_scalar(query, (start_date, end_date)) or 0.0
 
     if (df.empty or 'resolved_at' not in df.columns or
             'created_at' not in df.columns):
         return 0.0
 
-    # Ensure columns are datetime objects
-    df['resolved_at'] = pd.to_datetime(df['resolved_at'])
-    df['created_at'] = pd.to_datetime(df['created_at'])
+    df = _ensure_dt(df, ('created_at', 'resolved_at'))
 
     resolved_df = df[
-        df['status'].isin(['Resolved', 'Closed']) & df['resolved_at'].notna()
+        df['status'].isin(RESOLVED_STATUSES) & df['resolved_at'].notna()
     ]
     if resolved_df.empty:
         return 0.0
 
-    resolution_time = (
-        resolved_df['resolved_at'] - resolved_df['created_at']
-    ).dt.total_seconds() / 3600  # in hours
-    return resolution_time.mean()
+    resolution_time = _hours_between(
+        resolved_df['created_at'], resolved_df['resolved_at']
+    )
+    return float(np.nanmean(resolution_time))
+
+
+_rollup_exists = False
+
+def _has_rollup() -> bool:
+    """
+    Returns whether the roll-up table exists. Once it has been seen the
+    answer is kept for the life of the process.
+    """
+    global _rollup_exists
+    if not _rollup_exists:
+        _rollup_exists = _execute_scalar(Q_ROLLUP_EXISTS, (ROLLUP_TABLE,)) is not None
+    return _rollup_exists
+
+
+def _rollup_version():
+    """
+    Returns the data version counter, bumped by triggers on every tickets
+    write (and username change) from any connection. None if it cannot be
+    read, or before the roll-up (created with the counter) exists.
+    """
+    if not _has_rollup():
+        return None
+    return _execute_scalar(Q_ROLLUP_VERSION)
+
+
+def _versioned(cached_function, *args) -> pd.DataFrame:
+    """
+    Calls an lru_cache'd query function keyed by the current data version,
+    so cached results are reused until the tickets change. This is the only
+    invalidation the analytics caches need. Falls back to an
+    uncached call when the version is unavailable. Returns a copy.
+    """
+    version = _rollup_version()
+    if version is None:
+        return cached_function.__wrapped__(*args, version)
+    return cached_function(*args, version).copy()
+
+
+@lru_cache(maxsize=256)
+def _counts_by_category(start_date, end_date, limit, version) -> pd.DataFrame:
+    rollup = _has_rollup()
+    if limit is None:
+        query = Q_COUNTS_BY_CATEGORY if rollup else Q_COUNTS_BY_CATEGORY_TICKETS
+        return _execute_df_small(query, (start_date, end_date))
+    query = Q_TOP_CATEGORIES if rollup else Q_TOP_CATEGORIES_TICKETS
+    return _execute_df_small(query, (start_date, end_date, limit))
+
+
+@lru_cache(maxsize=256)
+def _counts_by_priority(start_date, end_date, version) -> pd.DataFrame:
+    query = Q_COUNTS_BY_PRIORITY if _has_rollup() else Q_COUNTS_BY_PRIORITY_TICKETS
+    return _execute_df_small(query, (start_date, end_date))
+
+
+@lru_cache(maxsize=256)
+def _trends(start_date, end_date, grouping, version) -> pd.DataFrame:
+    queries = Q_TRENDS if _has_rollup() else Q_TRENDS_TICKETS
+    query = queries.get(grouping, queries['daily'])
+    return _execute_df_small(query, (start_date, end_date))
 
 
 def get_ticket_counts_by_category(
-    df: pd.DataFrame = None, start_date: str = None, end_date: str = None
+    df: pd.DataFrame = None, start_date: str = None, end_date: str = None,
+    limit: int = None
 ) -> pd.DataFrame:
     """
     Gets the count of tickets for each category.
     If a DataFrame is provided, it calculates the metric based on it.
+    When querying, `limit` caps the number of (most common) categories returned.
     """
     if df is None:
         if not start_date or not end_date:
             return pd.DataFrame()
-        query = """
-            SELECT category, COUNT(id) as count
-            FROM tickets
-            WHERE created_at BETWEEN ? AND ?
-            GROUP BY category
-            ORDER BY
-                count DESC
-        """
-        df = _execute_query(query, (start_date, end_date))
+        # Already aggregated and ordered by SQL.
+        return _versioned(_counts_by_category, start_date, end_date, limit)
 
     if df.empty:
         return pd.DataFrame()
 
-    return df['category'].value_counts().reset_index()
+    counts = df.groupby('category', sort=False, observed=True).size()
+    counts = counts.reset_index(name='count')
+    return counts.sort_values(
+        'count', ascending=False, kind='stable', ignore_index=True
+    )
 
 
 def get_ticket_counts_by_priority(
@@ -120,26 +581,17 @@ def get_ticket_counts_by_priority(
     if df is None:
         if not start_date or not end_date:
             return pd.DataFrame()
-        query = """
-            SELECT priority, COUNT(id) as count
-            FROM tickets
-            WHERE created_at BETWEEN ? AND ?
-            GROUP BY priority
-            ORDER BY
-                CASE priority
-                    WHEN 'Critical' THEN 1
-                    WHEN 'High' THEN 2
-                    WHEN 'Medium' THEN 3
-                    WHEN 'Low' THEN 4
-                    ELSE 5
-                END
-        """
-        df = _execute_query(query, (start_date, end_date))
-    
+        # Already aggregated and ordered by SQL.
+        return _versioned(_counts_by_priority, start_date, end_date)
+
     if df.empty:
         return pd.DataFrame()
 
-    return df['priority'].value_counts().reset_index()
+    counts = df.groupby('priority', sort=False, observed=True).size()
+    counts = counts.reset_index(name='count')
+    return counts.sort_values(
+        'count', ascending=False, kind='stable', ignore_index=True
+    )
 
 
 def get_ticket_trends(
@@ -153,45 +605,22 @@ def get_ticket_trends(
     if df is None:
         if not start_date or not end_date:
             return pd.DataFrame()
-        group_formats = {
-            'daily': '%Y-%m-%d',
-            'weekly': '%Y-%W',
-            'monthly': '%Y-%m'
-        }
-        date_format = group_formats.get(grouping, '%Y-%m-%d')
-        query = f"""
-            SELECT STRFTIME('{date_format}', created_at) as date,
-            COUNT(id) as count
-            FROM tickets
-            WHERE created_at BETWEEN ? AND ?
-            GROUP BY date
-            ORDER BY
-                date ASC
-        """
-        df = _execute_query(query, (start_date, end_date))
-        return df
+        return _versioned(_trends, start_date, end_date, grouping)
 
     if df.empty:
         return pd.DataFrame()
         
-    df['created_at'] = pd.to_datetime(df['created_at'])
-    
-    # Resample based on the grouping
-    if grouping == 'daily':
-        resampler = 'D'
-    elif grouping == 'weekly':
-        resampler = 'W'
-    elif grouping == 'monthly':
-        resampler = 'M'
-    else:
-        resampler = 'D'
-        
-    trends = df.set_index('created_at').resample(resampler).size().reset_index(name='count')
-    trends = trends.rename(columns={'created_at': 'date'})
-    return trends
+    # Label each ticket with the last day of its period (as resample() did)
+    # and group on that, so only periods that have tickets produce rows.
+    period = TREND_PERIODS.get(grouping, TREND_PERIODS['daily'])
+    created_at = _ensure_dt(df, ('created_at',))['created_at']
+    dates = created_at.dt.to_period(period).dt.end_time.dt.normalize()
+
+    trends = dates.groupby(dates, sort=True).size()
+    trends.index.name = 'date'
+    return trends.reset_index(name='count')
 
 
-@st.cache_data
 def get_created_vs_resolved_trends(
     start_date: str, end_date: str, grouping: str = 'daily', user_id: int = None
 ) -> pd.DataFrame:
@@ -207,64 +636,28 @@ def get_created_vs_resolved_trends(
     Returns:
         pd.DataFrame: DataFrame with 'date', 'created', and 'resolved' columns.
     """
-    group_formats = {
-        'daily': '%Y-%m-%d',
-        'weekly': '%Y-%W',
-        'monthly': '%Y-%m'
-    }
-    date_format = group_formats.get(grouping, '%Y-%m-%d')
-
-    user_role = None
-    if user_id:
-        user = get_user(user_id=user_id)
-        if user:
-            user_role = user['role']
-
-    created_query_parts = [
-        f"SELECT STRFTIME('{date_format}', created_at) as date, "
-        "COUNT(id) as created",
-        "FROM tickets",
-        "WHERE created_at BETWEEN ? AND ?"
-    ]
-    resolved_query_parts = [
-        f"SELECT STRFTIME('{date_format}', resolved_at) as date, "
-        "COUNT(id) as resolved",
-        "FROM tickets",
-        "WHERE resolved_at IS NOT NULL AND resolved_at BETWEEN ? AND ?"
-    ]
-    
-    created_params = [start_date, end_date]
-    resolved_params = [start_date, end_date]
-
-    if user_role == 'customer':
-        created_query_parts.append("AND customer_id = ?")
-        resolved_query_parts.append("AND customer_id = ?")
-        created_params.append(user_id)
-        resolved_params.append(user_id)
-    elif user_role == 'agent':
-        created_query_parts.append("AND agent_id = ?")
-        resolved_query_parts.append("AND agent_id = ?")
-        created_params.append(user_id)
-        resolved_params.append(user_id)
-
-    created_query_parts.append("GROUP BY date")
-    resolved_query_parts.append("GROUP BY date")
-
-    created_query = " ".join(created_query_parts)
-    resolved_query = " ".join(resolved_query_parts)
-    
-    created_df = _execute_query(created_query, tuple(created_params))
-    resolved_df = _execute_query(resolved_query, tuple(resolved_params))
+    if grouping not in GROUP_FORMATS:
+        grouping = 'daily'
 
-    if created_df.empty and resolved_df.empty:
-        return pd.DataFrame(columns=['date', 'created', 'resolved'])
+    user_role = get_user_role(user_id) if user_id else None
 
-    merged_df = pd.merge(
-        created_df, resolved_df, on='date', how='outer'
-    ).fillna(0)
-    merged_df['created'] = merged_df['created'].astype(int)
-    merged_df['resolved'] = merged_df['resolved'].astype(int)
-    return merged_df.sort_values('date').reset_index(drop=True)
+    user_column = ROLE_SCOPE_COLUMNS.get(user_role)
+
+    if user_column:
+        query = Q_CREATED_VS_RESOLVED[(grouping, user_column)]
+        params = (start_date, end_date, user_id) * 2
+    elif _has_rollup():
+        # The roll-up buckets created and resolved counts on the same day.
+        query = Q_CREATED_VS_RESOLVED[(grouping, None)]
+        params = (start_date, end_date)
+    else:
+        query = Q_CREATED_VS_RESOLVED_TICKETS[grouping]
+        params = (start_date, end_date) * 2
+    df = _execute_query(query, params)
+
+    if df.empty:
+        return pd.DataFrame(columns=['date', 'created', 'resolved'])
+    return df
 
 
 def get_recurring_issues(start_date: str, end_date: str, top_n: int = 5) -> pd.DataFrame:
@@ -279,13 +672,11 @@ def get_recurring_issues(start_date: str, end_date: str, top_n: int = 5) -> pd.D
     Returns:
         pd.DataFrame: DataFrame with the top N 'category' and their 'count'.
     """
-    df = get_ticket_counts_by_category(
-        start_date, end_date
+    return get_ticket_counts_by_category(
+        start_date=start_date, end_date=end_date, limit=top_n
     )
-    return df.head(top_n)
 
 
-@st.cache_data
 def get_agent_performance_metrics(
     start_date: str, end_date: str, user_id: int = None
 ) -> pd.DataFrame:
@@ -302,54 +693,28 @@ def get_agent_performance_metrics(
                       'agent_name', 'tickets_assigned', 'tickets_resolved',
                       and 'avg_resolution_time_hours'.
     """
-    user_role = None
-    if user_id:
-        user = get_user(user_id=user_id)
-        if user:
-            user_role = user['role']
-
-    query_parts = [
-        "SELECT u.username as agent_name, t.agent_id, t.status, "
-        "t.created_at, t.resolved_at",
-        "FROM tickets t JOIN users u ON t.agent_id = u.id",
-        "WHERE t.agent_id IS NOT NULL AND t.created_at BETWEEN ? AND ?"
-    ]
-    params = [start_date, end_date]
+    user_role = get_user_role(user_id) if user_id else None
 
-    if user_role == 'agent':
-        query_parts.append("AND t.agent_id = ?")
-        params.append(user_id)
-    
-    query = " ".join(query_parts)
-    df = _execute_query(query, tuple(params))
+    user_column = 'agent_id' if user_role == 'agent' else None
+    params = [start_date, end_date] + ([user_id] if user_column else [])
 
-    if df.empty:
+    query = Q_AGENT_PERFORMANCE[user_column]
+    perf_df = _execute_query(query, tuple(params))
+
+    if perf_df.empty:
         return pd.DataFrame(columns=['agent_name', 'tickets_assigned', 'tickets_resolved', 'avg_resolution_time_hours'])
 
-    df_resolved = df[df['resolved_at'].notna()].copy()
-    df_resolved['resolution_time_hours'] = (
-        df_resolved['resolved_at'] - df_resolved['created_at']
-    ).dt.total_seconds() / 3600
+    # An all-NULL average comes back as an object column; keep it float.
+    return perf_df.astype({'avg_resolution_time_hours': float}).fillna(0)
 
-    assigned_counts = df.groupby('agent_name').size().reset_index(
-        name='tickets_assigned'
-    )
-    resolved_counts = df[
-        df['status'].isin(['Resolved', 'Closed'])
-    ].groupby('agent_name').size().reset_index(name='tickets_resolved')
-    avg_resolution = df_resolved.groupby('agent_name')[
-        'resolution_time_hours'
-    ].mean().reset_index(name='avg_resolution_time_hours')
-
-    perf_df = pd.merge(
-        assigned_counts, resolved_counts, on='agent_name', how='left'
-    )
-    perf_df = pd.merge(perf_df, avg_resolution, on='agent_name', how='left')
 
-    return perf_df.fillna(0)
+def _resolution_time_query(group_column: str, user_column: str) -> str:
+    """Picks the resolution-time query, avoiding the roll-up until it exists."""
+    if user_column is None and not _has_rollup():
+        return Q_RESOLUTION_TIME_TICKETS[group_column]
+    return Q_RESOLUTION_TIME[(group_column, user_column)]
 
 
-@st.cache_data
 def get_resolution_time_by_category(
     start_date: str, end_date: str, user_id: int = None
 ) -> pd.DataFrame:
@@ -364,40 +729,20 @@ def get_resolution_time_by_category(
     Returns:
         pd.DataFrame: DataFrame with 'category' and 'avg_resolution_hours'.
     """
-    user_role = None
-    if user_id:
-        user = get_user(user_id=user_id)
-        if user:
-            user_role = user['role']
-
-    query_parts = [
-        "SELECT category, JULIANDAY(resolved_at) - "
-        "JULIANDAY(created_at) as resolution_days",
-        "FROM tickets",
-        "WHERE status IN ('Resolved', 'Closed') AND resolved_at IS NOT NULL "
-        "AND resolved_at BETWEEN ? AND ?"
-    ]
-    params = [start_date, end_date]
+    user_role = get_user_role(user_id) if user_id else None
 
-    if user_role == 'customer':
-        query_parts.append("AND customer_id = ?")
-        params.append(user_id)
-    elif user_role == 'agent':
-        query_parts.append("AND agent_id = ?")
-        params.append(user_id)
+    user_column = ROLE_SCOPE_COLUMNS.get(user_role)
+    params = [start_date, end_date] + ([user_id] if user_column else [])
 
-    query = " ".join(query_parts)
+    query = _resolution_time_query('category', user_column)
     df = _execute_query(query, tuple(params))
 
     if df.empty:
         return pd.DataFrame()
 
-    df['avg_resolution_hours'] = df['resolution_days'] * 24
-    return df.groupby('category')['avg_resolution_hours'].mean() \
-        .reset_index().sort_values('avg_resolution_hours', ascending=False)
+    return df
 
 
-@st.cache_data
 def get_resolution_time_by_priority(
     start_date: str, end_date: str, user_id: int = None
 ) -> pd.DataFrame:
@@ -412,40 +757,42 @@ def get_resolution_time_by_priority(
     Returns:
         pd.DataFrame: DataFrame with 'priority' and 'avg_resolution_hours'.
     """
-    user_role = None
-    if user_id:
-        user = get_user(user_id=user_id)
-        if user:
-            user_role = user['role']
-
-    query_parts = [
-        "SELECT priority, JULIANDAY(resolved_at) - "
-        "JULIANDAY(created_at) as resolution_days",
-        "FROM tickets",
-        "WHERE status IN ('Resolved', 'Closed') AND resolved_at IS NOT NULL "
-        "AND resolved_at BETWEEN ? AND ?"
-    ]
-    params = [start_date, end_date]
+    user_role = get_user_role(user_id) if user_id else None
 
-    if user_role == 'customer':
-        query_parts.append("AND customer_id = ?")
-        params.append(user_id)
-    elif user_role == 'agent':
-        query_parts.append("AND agent_id = ?")
-        params.append(user_id)
+    user_column = ROLE_SCOPE_COLUMNS.get(user_role)
+    params = [start_date, end_date] + ([user_id] if user_column else [])
 
-    query = " ".join(query_parts)
+    query = _resolution_time_query('priority', user_column)
     df = _execute_query(query, tuple(params))
 
     if df.empty:
         return pd.DataFrame()
 
-    df['avg_resolution_hours'] = df['resolution_days'] * 24
-    return df.groupby('priority')['avg_resolution_hours'].mean() \
-        .reset_index().sort_values('avg_resolution_hours', ascending=False)
+    return df
+
+
+def dashboard_bundle(
+    start_date: str, end_date: str, user_id: int = None, grouping: str = 'daily',
+    include_agent_performance: bool = False
+) -> dict:
+    """
+    Runs the date-range dashboard queries and returns their results keyed
+    by name. They run one after another: most are served from the
+    version-keyed caches or the roll-up, so a thread pool per rerun would
+    cost more than it saves.
+    'agent_performance' is only queried (and returned) when
+    `include_agent_performance` is set, since only admins see it.
+    """
+    tasks = {
+        'resolution_by_category': (get_resolution_time_by_category, (start_date, end_date, user_id)),
+        'resolution_by_priority': (get_resolution_time_by_priority, (start_date, end_date, user_id)),
+        'created_vs_resolved': (get_created_vs_resolved_trends, (start_date, end_date, grouping, user_id)),
+    }
+    if include_agent_performance:
+        tasks['agent_performance'] = (get_agent_performance_metrics, (start_date, end_date, user_id))
+    return {name: function(*args) for name, (function, args) in tasks.items()}
 
 
-@st.cache_data
 def get_tickets_for_analytics(
     start_date: str, end_date: str, user_role: str = None, user_id: int = None
 ) -> pd.DataFrame:
@@ -461,30 +808,59 @@ def get_tickets_for_analytics(
     Returns:
         pd.DataFrame: A DataFrame containing the filtered tickets.
     """
-    base_query = (
-        "SELECT * FROM tickets "
-        "WHERE created_at BETWEEN ? AND ?"
-    )
-    params = [start_date, end_date]
-
-    if user_role == 'customer' and user_id:
-        base_query += " AND customer_id = ?"
-        params.append(user_id)
-    elif user_role == 'agent' and user_id:
-        base_query += " AND agent_id = ?"
-        params.append(user_id)
+    user_column = ROLE_SCOPE_COLUMNS.get(user_role) if user_id else None
+    params = [start_date, end_date] + ([user_id] if user_column else [])
     
-    return _execute_query(base_query, tuple(params))
+    return _execute_query(
+        Q_TICKETS_FOR_ANALYTICS[user_column], tuple(params),
+        parse_dates=['created_at', 'resolved_at', 'updated_at']
+    )
+
+
+def _json_filter(values) -> str:
+    """
+    Encodes an optional filter list as a JSON array; None means no filter.
+    Missing values (None or NaN, e.g. a ticket without a priority) are
+    encoded as JSON null rather than the strings "None" or "nan".
+    """
+    if values is None:
+        return None
+    return json.dumps([None if pd.isna(v) else str(v) for v in values])
 
 
-def get_status_breakdown_per_category(df: pd.DataFrame) -> pd.DataFrame:
+def get_status_breakdown_per_category(
+    df: pd.DataFrame = None, start_date: str = None, end_date: str = None,
+    user_id: int = None, categories: tuple = None, priorities: tuple = None,
+    statuses: tuple = None
+) -> pd.DataFrame:
     """
     Calculates the count of tickets per status for each category.
+    Without a DataFrame, counts in SQL over tickets created in the date range,
+    scoped to the user's role and limited to the given categories, priorities
+    and statuses (None means all). With a DataFrame (tickets already loaded
+    and filtered, as on the Analytics page), counts it in memory instead.
     """
+    if df is None:
+        if not start_date or not end_date:
+            return pd.DataFrame()
+        user_role = get_user_role(user_id) if user_id else None
+        user_column = ROLE_SCOPE_COLUMNS.get(user_role)
+        params = (
+            start_date, end_date, _json_filter(categories),
+            _json_filter(priorities), _json_filter(statuses)
+        ) + ((user_id,) if user_column else ())
+        df = _execute_query(Q_STATUS_BREAKDOWN[user_column], params)
+        if df.empty:
+            return pd.DataFrame()
+        return df
+
     if df.empty:
         return pd.DataFrame()
 
-    return df.groupby(['category', 'status']).size().reset_index(name='count')
+    # dropna=False keeps tickets without a category, as the SQL path does.
+    return df.groupby(
+        ['category', 'status'], observed=True, dropna=False
+    ).size().reset_index(name='count')
 
 
 def get_open_ticket_age_distribution(df: pd.DataFrame) -> pd.DataFrame:
@@ -501,53 +877,23 @@ def get_open_ticket_age_distribution(df: pd.DataFrame) -> pd.DataFrame:
                       for open tickets. Returns an empty DataFrame if no open 
                       tickets are found.
     """
-    open_tickets = df[df['status'].isin(['Open', 'In Progress'])].copy()
+    open_tickets = df.loc[
+        df['status'].isin(OPEN_STATUSES), ['title', 'category', 'created_at']
+    ]
     if open_tickets.empty:
         return pd.DataFrame({'title': [], 'category': [], 'age_days': []})
 
-    open_tickets['created_at'] = pd.to_datetime(open_tickets['created_at'])
-    now = datetime.now()
-    open_tickets['age'] = now - open_tickets['created_at']
-    open_tickets['age_days'] = open_tickets['age'].dt.days
-
-    return open_tickets[['title', 'category', 'age_days']]
+    # Whole days elapsed (floored, like Timedelta.days), on int64 views.
+    created_ns = _ensure_dt(open_tickets, ('created_at',))['created_at'] \
+        .to_numpy(dtype='datetime64[ns]')
+    # created_at is stored in UTC (SQLite CURRENT_TIMESTAMP).
+    now_ns = np.datetime64(datetime.now(timezone.utc).replace(tzinfo=None), 'ns')
+    age_days = (now_ns.view('i8') - created_ns.view('i8')) // NS_PER_DAY
+    missing = np.isnat(created_ns)
+    if missing.any():
+        age_days = np.where(missing, np.nan, age_days)
 
-
-# List of common English stop words (can be expanded)
-STOP_WORDS = set([
-    "a", "an", "the", "and", "but", "or", "for", "nor", "on", "at", "to",
-    "from", "by", "with", "about", "as", "is", "was", "were", "be", "been",
-    "being", "have", "has", "had", "do", "does", "did", "not", "no", "don",
-    "t", "s", "m", "ll", "ve", "re", "just", "can", "will", "would",
-    "should", "could", "get", "go", "make", "know", "see", "take", "come",
-    "think", "look", "want", "give", "use", "find", "tell", "ask", "work",
-    "seem", "feel", "try", "leave", "call", "good", "new", "first", "last",
-    "long", "great", "little", "own", "other", "old", "right", "big",
-    "high", "different", "small", "large", "next", "early", "important",
-    "few", "public", "bad", "same", "able", "back", "any", "each", "every",
-    "many", "much", "some", "such", "up", "down", "out", "in", "off",
-    "over", "under", "again", "further", "then", "once", "here", "there",
-    "when", "where", "why", "how", "all", "any", "both", "each", "few",
-    "more", "mocouldst", "other", "some", "such", "no", "nor", "not", "only",
-    "own", "same", "so", "than", "too", "very", "can", "will", "just",
-    "don't", "shouldn't", "now", "i", "me", "my", "myself", "we", "our",
-    "ours", "ourselves", "you", "your", "yours", "yourself", "yourselves",
-    "he", "him", "his", "himself", "she", "her", "hers", "herself", "it",
-    "its", "itself", "they", "them", "their", "theirs", "themselves",
-    "what", "which", "who", "whom", "this", "that", "these", "those", "am",
-    "is", "are", "was", "were", "be", "been", "being", "have", "has",
-    "had", "having", "do", "does", "did", "doing", "said", "from", "into",
-    "through", "during", "before", "after", "above", "below", "to", "from",
-    "up", "down", "in", "out", "on", "off", "over", "under", "again",
-    "further", "then", "once", "here", "there", "when", "where", "why",
-    "how", "all", "any", "both", "each", "few", "more", "most", "other",
-    "some", "such", "no", "nor", "not", "only", "own", "same", "so", "than",
-    "too", "very", "s", "t", "can", "will", "just", "don", "should", "now",
-    "id", "im", "youre", "dont", "cant", "wouldnt", "nt", "shoudnt",
-    "mustnt", "like", "get", "go", "one", "two", "three", "four", "five",
-    "six", "seven", "eight", "nine", "ten", "day", "week", "month", "year",
-    "issue", "problem", "report", "request", "ticket", "service", "support"
-])
+    return open_tickets[['title', 'category']].assign(age_days=age_days)
 
 
 def get_top_keywords(
@@ -571,19 +917,12 @@ def get_top_keywords(
         df['title'] + " " + df['description'].fillna('')
     ).str.lower()
 
-    # Tokenize, remove punctuation, filter stop words and short words
-    all_words = []
-    for text in text_data:
-        # Remove non-alphabetic characters and split into words
-        words = re.findall(r'[a-z]+', text)
-        filtered_words = [
-            word for word in words
-            if word not in STOP_WORDS and len(word) > 2
-        ]
-        all_words.extend(filtered_words)
+    # Tokenize into alphabetic words of 3+ letters, then drop stop words
+    words = text_data.str.findall(KEYWORD_PATTERN).explode().dropna()
+    words = words[~words.isin(STOP_WORDS)]
 
     # Count word frequencies
-    word_counts = Counter(all_words)
+    word_counts = Counter(words.to_numpy())
 
     # Convert to DataFrame
     keywords_df = pd.DataFrame(word_counts.most_common(top_n),
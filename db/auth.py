@@ -1,5 +1,5 @@
-from .users import get_user
-from auth_utils import verify_password
+from .users import get_user, update_password_hash
+from auth_utils import is_legacy_hash, verify_password
 
 def login_user(username_or_email, password):
     """
@@ -21,11 +21,10 @@ def login_user(username_or_email, password):
     
     if user and verify_password(password, user['password_hash']):
         # If login is successful, check if the hash needs to be upgraded.
-        # A simple check for the bcrypt prefix is sufficient here.
-        # if not user['password_hash'].startswith('$2b$'):
-        #     new_hash = hash_password(password)
-        #     update_password_hash(user['id'], new_hash)
-        #     user['password_hash'] = new_hash  # Update hash in the in-memory user dict
+        # Legacy unsalted SHA-256 digests are replaced with a salted hash.
+        if is_legacy_hash(user['password_hash']):
+            if update_password_hash(user['id'], password):
+                user = get_user(user_id=user['id'])  # Pick up the new hash
 
         return user
         
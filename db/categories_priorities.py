@@ -1,60 +1,112 @@
 import sqlite3
-import pandas as pd
-from .database import get_db_connection
+from functools import lru_cache
+from .pool import pooled_connection, read_dataframe
+
+# Both tables are tiny and rarely written, so reads are cached per process
+# and every writer below clears the cache. Callers get a copy.
 
 # --- Category & Priority CRUD ---
 def get_categories(include_archived=False):
-    conn = get_db_connection()
+    return _get_categories_cached(include_archived).copy()
+
+@lru_cache(maxsize=2)
+def _get_categories_cached(include_archived):
     query = "SELECT * FROM categories"
     if not include_archived:
         query += " WHERE archived = 0"
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
+    with pooled_connection() as conn:
+        return read_dataframe(conn, query)
 
 def add_category(name, description, color):
-    conn = get_db_connection()
-    try:
+    with pooled_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("INSERT INTO categories (name, description, color) VALUES (?, ?, ?)", (name, description, color))
+        # A duplicate name inserts nothing and returns no row.
+        cursor.execute(
+            "INSERT INTO categories (name, description, color) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO NOTHING RETURNING id",
+            (name, description, color)
+        )
+        row = cursor.fetchone()
         conn.commit()
-        return cursor.lastrowid
-    except sqlite3.IntegrityError:
-        return None
-    finally:
-        conn.close()
+        _clear_caches()
+        return row['id'] if row else None
 
 def update_category(cat_id, name, description, color):
-    conn = get_db_connection()
-    try:
+    with pooled_connection() as conn:
+        try:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE categories SET name=?, description=?, color=? WHERE id=?", (name, description, color, cat_id))
+            conn.commit()
+            _clear_caches()
+            return cursor.rowcount > 0
+        except sqlite3.IntegrityError:
+            return False
+
+def archive_category(cat_id, archived=True):
+    with pooled_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("UPDATE categories SET name=?, description=?, color=? WHERE id=?", (name, description, color, cat_id))
+        cursor.execute("UPDATE categories SET archived = ? WHERE id = ?", (1 if archived else 0, cat_id))
         conn.commit()
+        _clear_caches()
         return cursor.rowcount > 0
-    except sqlite3.IntegrityError:
-        return False
-    finally:
-        conn.close()
-
-def archive_category(cat_id, archived=True):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE categories SET archived = ? WHERE id = ?", (1 if archived else 0, cat_id))
-    conn.commit()
-    conn.close()
-    return cursor.rowcount > 0
 
 def get_priorities():
-    conn = get_db_connection()
-    df = pd.read_sql_query("SELECT * FROM priorities ORDER BY sort_order", conn)
-    conn.close()
-    return df
+    return _get_priorities_cached().copy()
+
+@lru_cache(maxsize=1)
+def _get_priorities_cached():
+    with pooled_connection() as conn:
+        return read_dataframe(conn, "SELECT * FROM priorities ORDER BY sort_order")
+
+def get_category_lookup():
+    """Maps every category name, archived ones included, to its row as a dict. Read-only."""
+    return _category_lookup()
+
+def get_priority_lookup():
+    """Maps every priority name to its row as a dict. Read-only."""
+    return _priority_lookup()
+
+@lru_cache(maxsize=1)
+def _category_lookup():
+    with pooled_connection() as conn:
+        return {row['name']: dict(row) for row in conn.execute("SELECT * FROM categories")}
+
+@lru_cache(maxsize=1)
+def _priority_lookup():
+    with pooled_connection() as conn:
+        return {row['name']: dict(row) for row in conn.execute("SELECT * FROM priorities")}
+
+def is_valid_category(name):
+    """True if `name` is an active (non-archived) category."""
+    return name in _category_names()
+
+def is_valid_priority(name):
+    """True if `name` is a defined priority."""
+    return name in _priority_names()
+
+@lru_cache(maxsize=1)
+def _category_names():
+    with pooled_connection() as conn:
+        return frozenset(row['name'] for row in conn.execute("SELECT name FROM categories WHERE archived = 0"))
+
+@lru_cache(maxsize=1)
+def _priority_names():
+    with pooled_connection() as conn:
+        return frozenset(row['name'] for row in conn.execute("SELECT name FROM priorities"))
+
+def _clear_caches():
+    _get_categories_cached.cache_clear()
+    _get_priorities_cached.cache_clear()
+    _category_names.cache_clear()
+    _priority_names.cache_clear()
+    _category_lookup.cache_clear()
+    _priority_lookup.cache_clear()
 
 def update_priority(prio_id, name, description, color):
     # In this implementation, only description and color are editable. Name is fixed.
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE priorities SET description=?, color=? WHERE id=?", (description, color, prio_id))
-    conn.commit()
-    conn.close()
-    return cursor.rowcount > 0
\ No newline at end of file
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE priorities SET description=?, color=? WHERE id=?", (description, color, prio_id))
+        conn.commit()
+        _clear_caches()
+        return cursor.rowcount > 0
@@ -1,135 +1,234 @@
-from database import get_db_connection
+from db.database import get_db_connection
+from db.materialized import ROLLUP_TABLE, VERSION_TABLE, ROLLUP_TRIGGERS, create_ticket_rollups
+from db.pool import SHARED_CONNECTION_PRAGMAS
+
+# Static schema, created in one script and one transaction.
+# Timestamps are stored as naive UTC text, the format of CURRENT_TIMESTAMP;
+# every writer (tickets, settings, activity logs, seeds) uses UTC.
+SCHEMA = """
+    BEGIN;
+
+    -- --- Users Table ---
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL UNIQUE,
+        email TEXT NOT NULL UNIQUE,
+        password_hash TEXT NOT NULL,
+        role TEXT NOT NULL CHECK(role IN ('admin', 'agent', 'customer')),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- --- Categories Table ---
+    CREATE TABLE IF NOT EXISTS categories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        description TEXT,
+        color TEXT,
+        archived INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- --- Priorities Table ---
+    CREATE TABLE IF NOT EXISTS priorities (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        description TEXT,
+        color TEXT,
+        sort_order INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- --- Tickets Table ---
+    -- NOTE: Existing schema. No changes needed for now to maintain compatibility.
+    -- Future state: category and priority columns should be foreign keys.
+    CREATE TABLE IF NOT EXISTS tickets (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        description TEXT NOT NULL,
+        category TEXT,
+        priority TEXT CHECK(priority IN ('Low', 'Medium', 'High', 'Critical')),
+        status TEXT CHECK(status IN ('Open', 'In Progress', 'Resolved', 'Closed')),
+        customer_id INTEGER NOT NULL,
+        agent_id INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP,
+        resolved_at TIMESTAMP,
+        FOREIGN KEY (customer_id) REFERENCES users (id),
+        FOREIGN KEY (agent_id) REFERENCES users (id)
+    );
+
+    -- --- SLA Settings Table ---
+    CREATE TABLE IF NOT EXISTS sla_settings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        priority_id INTEGER NOT NULL UNIQUE,
+        response_time_hours INTEGER NOT NULL,
+        resolution_time_hours INTEGER NOT NULL,
+        updated_at TIMESTAMP,
+        FOREIGN KEY (priority_id) REFERENCES priorities (id)
+    );
+
+    -- --- System Settings Table ---
+    CREATE TABLE IF NOT EXISTS system_settings (
+        setting_key TEXT PRIMARY KEY,
+        setting_value TEXT,
+        updated_at TIMESTAMP,
+        updated_by INTEGER,
+        FOREIGN KEY (updated_by) REFERENCES users (id)
+    );
+
+    -- --- Activity Logs Table ---
+    CREATE TABLE IF NOT EXISTS activity_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        action_type TEXT NOT NULL,
+        resource_type TEXT,
+        resource_id INTEGER,
+        details TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    );
+
+    COMMIT;
+"""
+
+# Indexes for analytics and activity log filters. Created after the column
+# migrations below, since some cover migrated columns.
+INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_tickets_created ON tickets(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_tickets_resolved ON tickets(resolved_at, status)",
+    "CREATE INDEX IF NOT EXISTS idx_tickets_agent ON tickets(agent_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_tickets_customer ON tickets(customer_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_tickets_priority_rank ON tickets(priority_rank)",
+    "CREATE INDEX IF NOT EXISTS idx_tickets_status ON tickets(status, updated_at)",
+    "CREATE INDEX IF NOT EXISTS idx_logs_ts ON activity_logs(timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_logs_user ON activity_logs(user_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_logs_action ON activity_logs(action_type)",
+)
+
+DEFAULT_CATEGORIES = [
+    ('Technical', 'Issues related to technical problems.', '#3B82F6'),
+    ('Billing', 'Billing and payment questions.', '#F59E0B'),
+    ('General Inquiry', 'General questions about products or services.', '#10B981'),
+    ('Bug Report', 'Reporting software bugs.', '#EF4444'),
+    ('Feature Request', 'Requesting new features.', '#A855F7')
+]
+
+DEFAULT_PRIORITIES = [
+    ('Low', 'Non-critical issues.', '#22C55E', 1),
+    ('Medium', 'Standard issues.', '#F59E0B', 2),
+    ('High', 'Urgent issues.', '#F97316', 3),
+    ('Critical', 'System-down or critical impact issues.', '#EF4444', 4)
+]
+
+_BACKFILL_PRIORITY_RANK = """
+    UPDATE tickets SET priority_rank = CASE priority
+        WHEN 'Critical' THEN 1
+        WHEN 'High' THEN 2
+        WHEN 'Medium' THEN 3
+        WHEN 'Low' THEN 4
+        ELSE 5
+    END
+    WHERE priority_rank IS NULL
+"""
+
+# Schema migrations, applied in order and tracked in PRAGMA user_version.
+# Each entry is (table, added column or None, follow-up statements).
+MIGRATIONS = (
+    # 1: user accounts can be deactivated
+    ('users', "status TEXT DEFAULT 'active' NOT NULL CHECK(status IN ('active', 'inactive'))", ()),
+    # 2: integer sort key for priority so reports can ORDER BY an indexed column
+    ('tickets', "priority_rank INTEGER", (_BACKFILL_PRIORITY_RANK,)),
+    # 3: roll-up keyed on NOT NULL category/priority; older tables held an
+    # unmerged row per write for NULL keys. create_ticket_rollups rebuilds
+    # it, aggregated from tickets with GROUP BY.
+    (ROLLUP_TABLE, None, (f"DROP TABLE IF EXISTS {ROLLUP_TABLE}",)),
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def _apply_migrations(cursor):
+    """Applies the migrations newer than the database's user_version."""
+    version = cursor.execute("PRAGMA user_version").fetchone()[0]
+    for table, column_def, statements in MIGRATIONS[version:]:
+        if column_def is not None:
+            column = column_def.split()[0]
+            # Databases from before user_version was tracked may already have the column.
+            if version == 0:
+                cursor.execute(f"PRAGMA table_info({table})")
+                exists = column in [col[1] for col in cursor.fetchall()]
+            else:
+                exists = False
+            if not exists:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column_def}")
+        for statement in statements:
+            cursor.execute(statement)
+    if version < SCHEMA_VERSION:
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
 
 def initialize_database():
     """
     Initializes and upgrades the database schema idempotently.
     """
     conn = get_db_connection()
+    # journal_mode = WAL is stored in the database file, so switching it here
+    # means every later connection starts in WAL mode.
+    for pragma in SHARED_CONNECTION_PRAGMAS:
+        conn.execute(pragma)
     cursor = conn.cursor()
 
-    # --- Create Users Table ---
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT NOT NULL UNIQUE,
-            email TEXT NOT NULL UNIQUE,
-            password_hash TEXT NOT NULL,
-            role TEXT NOT NULL CHECK(role IN ('admin', 'agent', 'customer')),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-    """)
-    # Add status column to users if it doesn't exist
-    cursor.execute("PRAGMA table_info(users)")
-    if 'status' not in [col[1] for col in cursor.fetchall()]:
-        cursor.execute("ALTER TABLE users ADD COLUMN status TEXT DEFAULT 'active' NOT NULL CHECK(status IN ('active', 'inactive'))")
-
-    # --- Create Categories Table ---
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS categories (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE,
-            description TEXT,
-            color TEXT,
-            archived INTEGER NOT NULL DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-    """)
+    cursor.executescript(SCHEMA)
+
+    # Migrations, seeds, indexes and the roll-up share one transaction.
+    # IMMEDIATE takes the write lock up front, so two processes starting at
+    # once apply the migrations one after the other.
+    cursor.execute("BEGIN IMMEDIATE")
+
+    _apply_migrations(cursor)
+
     # Seed default categories
-    default_categories = [
-        ('Technical', 'Issues related to technical problems.', '#3B82F6'),
-        ('Billing', 'Billing and payment questions.', '#F59E0B'),
-        ('General Inquiry', 'General questions about products or services.', '#10B981'),
-        ('Bug Report', 'Reporting software bugs.', '#EF4444'),
-        ('Feature Request', 'Requesting new features.', '#A855F7')
-    ]
     cursor.execute("SELECT COUNT(*) FROM categories")
     if cursor.fetchone()[0] == 0:
-        cursor.executemany("INSERT INTO categories (name, description, color) VALUES (?, ?, ?)", default_categories)
-
-    # --- Create Priorities Table ---
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS priorities (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE,
-            description TEXT,
-            color TEXT,
-            sort_order INTEGER,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-    """)
+        cursor.executemany("INSERT INTO categories (name, description, color) VALUES (?, ?, ?)", DEFAULT_CATEGORIES)
+
     # Seed default priorities
-    default_priorities = [
-        ('Low', 'Non-critical issues.', '#22C55E', 1),
-        ('Medium', 'Standard issues.', '#F59E0B', 2),
-        ('High', 'Urgent issues.', '#F97316', 3),
-        ('Critical', 'System-down or critical impact issues.', '#EF4444', 4)
-    ]
     cursor.execute("SELECT COUNT(*) FROM priorities")
     if cursor.fetchone()[0] == 0:
-        cursor.executemany("INSERT INTO priorities (name, description, color, sort_order) VALUES (?, ?, ?, ?)", default_priorities)
-
-    # --- Create Tickets Table ---
-    # NOTE: Existing schema. No changes needed for now to maintain compatibility.
-    # Future state: category and priority columns should be foreign keys.
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS tickets (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            description TEXT NOT NULL,
-            category TEXT,
-            priority TEXT CHECK(priority IN ('Low', 'Medium', 'High', 'Critical')),
-            status TEXT CHECK(status IN ('Open', 'In Progress', 'Resolved', 'Closed')),
-            customer_id INTEGER NOT NULL,
-            agent_id INTEGER,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP,
-            resolved_at TIMESTAMP,
-            FOREIGN KEY (customer_id) REFERENCES users (id),
-            FOREIGN KEY (agent_id) REFERENCES users (id)
-        );
-    """)
-
-    # --- Create SLA Settings Table ---
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS sla_settings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            priority_id INTEGER NOT NULL UNIQUE,
-            response_time_hours INTEGER NOT NULL,
-            resolution_time_hours INTEGER NOT NULL,
-            updated_at TIMESTAMP,
-            FOREIGN KEY (priority_id) REFERENCES priorities (id)
-        );
-    """)
-
-    # --- Create System Settings Table ---
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS system_settings (
-            setting_key TEXT PRIMARY KEY,
-            setting_value TEXT,
-            updated_at TIMESTAMP,
-            updated_by INTEGER,
-            FOREIGN KEY (updated_by) REFERENCES users (id)
-        );
-    """)
-
-    # --- Create Activity Logs Table ---
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS activity_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            action_type TEXT NOT NULL,
-            resource_type TEXT,
-            resource_id INTEGER,
-            details TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        );
-    """)
+        cursor.executemany("INSERT INTO priorities (name, description, color, sort_order) VALUES (?, ?, ?, ?)", DEFAULT_PRIORITIES)
+
+    for index in INDEXES:
+        cursor.execute(index)
+
+    # --- Daily roll-up for the analytics dashboard, kept current by triggers ---
+    create_ticket_rollups(cursor)
+
+    # Refresh planner statistics so the indexes above are chosen.
+    cursor.execute("ANALYZE")
 
     conn.commit()
     conn.close()
-    print("Database initialized/updated successfully.")
-    
+
+# Analytics roll-up objects (db/materialized.py) every database must have.
+ROLLUP_OBJECTS = (ROLLUP_TABLE, VERSION_TABLE) + tuple(ROLLUP_TRIGGERS)
+
+def ensure_database():
+    """
+    Runs initialize_database() if the database is behind SCHEMA_VERSION or
+    is missing any of the roll-up table, version counter and triggers.
+    The app calls it once at startup (auth_utils.ensure_database_ready), so
+    it never queries columns or tables that have not been created yet.
+    """
+    conn = get_db_connection()
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        present = conn.execute(
+            f"SELECT COUNT(*) FROM sqlite_master WHERE name IN ({', '.join('?' * len(ROLLUP_OBJECTS))})",
+            ROLLUP_OBJECTS
+        ).fetchone()[0]
+    finally:
+        conn.close()
+    if version < SCHEMA_VERSION or present < len(ROLLUP_OBJECTS):
+        initialize_database()
+
 if __name__ == '__main__':
     print("Initializing/updating the Suppocket database...")
-    initialize_database()
\ No newline at end of file
+    initialize_database()
+    print("Database initialized/updated successfully.")
@@ -0,0 +1,155 @@
+"""
+Daily roll-up of the tickets table for the analytics dashboard.
+
+`mv_tickets_daily` holds one row per (day, category, priority) with the
+number of tickets created and resolved that day and the resolution hours
+of the tickets resolved that day. Triggers on `tickets` keep it current,
+so unscoped analytics read a few rows per day instead of every ticket.
+A NULL category or priority is stored as '' (NULL_KEY): NULLs never
+collide on a primary key, so ON CONFLICT would never merge those rows.
+Readers map '' back to NULL.
+`mv_tickets_version` is a single counter bumped on every tickets write
+and username change, so callers can cache analytics results until the
+data they read changes.
+"""
+
+ROLLUP_TABLE = "mv_tickets_daily"
+NULL_KEY = "''"
+VERSION_TABLE = "mv_tickets_version"
+
+CREATE_ROLLUP_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+        day TEXT NOT NULL,
+        category TEXT NOT NULL,
+        priority TEXT NOT NULL,
+        priority_rank INTEGER,
+        created_count INTEGER NOT NULL DEFAULT 0,
+        resolved_count INTEGER NOT NULL DEFAULT 0,
+        n_resolved INTEGER NOT NULL DEFAULT 0,
+        sum_resolution_hours REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, category, priority)
+    )
+"""
+
+CREATE_VERSION_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+"""
+Q_ROLLUP_VERSION = f"SELECT version FROM {VERSION_TABLE} WHERE id = 1"
+_BUMP_VERSION = f"UPDATE {VERSION_TABLE} SET version = version + 1 WHERE id = 1;"
+
+# Hours from creation to resolution, as the analytics queries compute it.
+_HOURS = "(JULIANDAY({t}.resolved_at) - JULIANDAY({t}.created_at)) * 24.0"
+# A ticket counts towards average resolution time only once it is
+# Resolved/Closed and both timestamps parse.
+_COUNTS_FOR_RESOLUTION = (
+    "{t}.status IN ('Resolved', 'Closed') AND " + _HOURS + " IS NOT NULL"
+)
+
+def _key(expression):
+    """SQL storing `expression` as a roll-up key column, NULL as NULL_KEY."""
+    return f"IFNULL({expression}, {NULL_KEY})"
+
+def _apply_ticket(t, sign):
+    """SQL adding (sign=1) or removing (sign=-1) ticket row `t` from the roll-up."""
+    counted = _COUNTS_FOR_RESOLUTION.format(t=t)
+    hours = _HOURS.format(t=t)
+    return f"""
+        INSERT INTO {ROLLUP_TABLE} (day, category, priority, priority_rank, created_count)
+        SELECT {_key(f'DATE({t}.created_at)')}, {_key(f'{t}.category')}, {_key(f'{t}.priority')},
+               {t}.priority_rank, {sign}
+        WHERE {t}.created_at IS NOT NULL
+        ON CONFLICT (day, category, priority)
+        DO UPDATE SET created_count = created_count + excluded.created_count;
+        INSERT INTO {ROLLUP_TABLE} (
+            day, category, priority, priority_rank,
+            resolved_count, n_resolved, sum_resolution_hours
+        )
+        SELECT {_key(f'DATE({t}.resolved_at)')}, {_key(f'{t}.category')}, {_key(f'{t}.priority')},
+               {t}.priority_rank, {sign},
+               CASE WHEN {counted} THEN {sign} ELSE 0 END,
+               CASE WHEN {counted} THEN {sign} * {hours} ELSE 0 END
+        WHERE {t}.resolved_at IS NOT NULL
+        ON CONFLICT (day, category, priority)
+        DO UPDATE SET resolved_count = resolved_count + excluded.resolved_count,
+                      n_resolved = n_resolved + excluded.n_resolved,
+                      sum_resolution_hours = sum_resolution_hours + excluded.sum_resolution_hours;
+    """
+
+# Trigger name -> definition. Recreated on every initialisation so
+# databases pick up changes to the trigger bodies.
+ROLLUP_TRIGGERS = {
+    f"trg_{ROLLUP_TABLE}_insert": f"""
+    CREATE TRIGGER trg_{ROLLUP_TABLE}_insert AFTER INSERT ON tickets
+    BEGIN {_apply_ticket('NEW', 1)} {_BUMP_VERSION} END
+    """,
+    f"trg_{ROLLUP_TABLE}_delete": f"""
+    CREATE TRIGGER trg_{ROLLUP_TABLE}_delete AFTER DELETE ON tickets
+    BEGIN {_apply_ticket('OLD', -1)} {_BUMP_VERSION} END
+    """,
+    f"trg_{ROLLUP_TABLE}_update": f"""
+    CREATE TRIGGER trg_{ROLLUP_TABLE}_update
+    AFTER UPDATE OF created_at, resolved_at, status, category, priority, priority_rank ON tickets
+    BEGIN {_apply_ticket('OLD', -1)} {_apply_ticket('NEW', 1)} END
+    """,
+    # Any tickets update (assignment, text, updated_at) changes the
+    # analytics frames, not just the rolled-up columns.
+    f"trg_{VERSION_TABLE}_tickets_update": f"""
+    CREATE TRIGGER trg_{VERSION_TABLE}_tickets_update AFTER UPDATE ON tickets
+    BEGIN {_BUMP_VERSION} END
+    """,
+    # Agent performance reports usernames.
+    f"trg_{VERSION_TABLE}_username_update": f"""
+    CREATE TRIGGER trg_{VERSION_TABLE}_username_update AFTER UPDATE OF username ON users
+    BEGIN {_BUMP_VERSION} END
+    """,
+}
+
+_REFRESH_ROLLUP = f"""
+    INSERT INTO {ROLLUP_TABLE} (
+        day, category, priority, priority_rank, created_count,
+        resolved_count, n_resolved, sum_resolution_hours
+    )
+    SELECT day, category, priority, MIN(priority_rank), SUM(created_count),
+           SUM(resolved_count), SUM(n_resolved), SUM(sum_resolution_hours)
+    FROM (
+        SELECT {_key('DATE(t.created_at)')} as day, {_key('t.category')} as category,
+               {_key('t.priority')} as priority, t.priority_rank,
+               1 as created_count, 0 as resolved_count,
+               0 as n_resolved, 0 as sum_resolution_hours
+        FROM tickets t
+        WHERE t.created_at IS NOT NULL
+        UNION ALL
+        SELECT {_key('DATE(t.resolved_at)')}, {_key('t.category')}, {_key('t.priority')},
+               t.priority_rank, 0, 1,
+               CASE WHEN {_COUNTS_FOR_RESOLUTION.format(t='t')} THEN 1 ELSE 0 END,
+               CASE WHEN {_COUNTS_FOR_RESOLUTION.format(t='t')} THEN {_HOURS.format(t='t')} ELSE 0 END
+        FROM tickets t
+        WHERE t.resolved_at IS NOT NULL
+    )
+    GROUP BY day, category, priority
+"""
+
+def create_ticket_rollups(cursor):
+    """Creates the roll-up table and its triggers, filling it if it is new."""
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (ROLLUP_TABLE,)
+    )
+    is_new = cursor.fetchone() is None
+    cursor.execute(CREATE_ROLLUP_TABLE)
+    cursor.execute(CREATE_VERSION_TABLE)
+    cursor.execute(f"INSERT OR IGNORE INTO {VERSION_TABLE} (id, version) VALUES (1, 0)")
+    for name, trigger in ROLLUP_TRIGGERS.items():
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(trigger)
+    if is_new:
+        refresh_ticket_rollups(cursor)
+
+def refresh_ticket_rollups(cursor):
+    """Rebuilds the roll-up from the tickets table."""
+    cursor.execute(f"DELETE FROM {ROLLUP_TABLE}")
+    cursor.execute(_REFRESH_ROLLUP)
+    cursor.execute(_BUMP_VERSION)
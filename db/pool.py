@@ -0,0 +1,93 @@
+import atexit
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+import pandas as pd
+from .database import DATABASE_NAME
+
+# Applied once when a pooled connection is opened.
+SHARED_CONNECTION_PRAGMAS = (
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -64000",
+    "PRAGMA mmap_size = 268435456",
+)
+
+# Idle connections kept open between checkouts, per detect_types. Checkouts
+# beyond this (e.g. nested helpers) open an extra connection that is closed
+# on return.
+POOL_SIZE = 5
+
+_pools = {}
+_opened = []
+_opened_lock = threading.Lock()
+
+def _get_pool(detect_types):
+    with _opened_lock:
+        return _pools.setdefault(detect_types, queue.LifoQueue(maxsize=POOL_SIZE))
+
+def _open_connection(detect_types):
+    # check_same_thread=False because a connection may be checked out by
+    # any thread; the pool guarantees only one user at a time.
+    conn = sqlite3.connect(
+        DATABASE_NAME, detect_types=detect_types,
+        check_same_thread=False, cached_statements=256
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in SHARED_CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    with _opened_lock:
+        _opened.append(conn)
+    return conn
+
+def _release(conn, detect_types):
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        _get_pool(detect_types).put_nowait(conn)
+    except queue.Full:
+        with _opened_lock:
+            _opened.remove(conn)
+        conn.close()
+
+@contextmanager
+def pooled_connection(conn=None, detect_types=0):
+    """
+    Checks a connection out of the pool for the duration of the block.
+    Connections opened with different `detect_types` (e.g. PARSE_DECLTYPES
+    for analytics) are pooled separately.
+    If `conn` is given (callers that manage their own connection), it is
+    yielded as-is and left open. Uncommitted work is rolled back on return.
+    """
+    if conn is not None:
+        yield conn
+        return
+    try:
+        conn = _get_pool(detect_types).get_nowait()
+    except queue.Empty:
+        conn = _open_connection(detect_types)
+    try:
+        yield conn
+    finally:
+        _release(conn, detect_types)
+
+def read_dataframe(conn, query, params=()):
+    """
+    Runs `query` and returns its rows as a DataFrame. Builds the frame with
+    from_records, skipping read_sql_query's SQL-engine detection and extra
+    dtype passes, which dominate for the small result sets used here.
+    """
+    cursor = conn.execute(query, params)
+    return pd.DataFrame.from_records(cursor.fetchall(), columns=[column[0] for column in cursor.description])
+
+def _close_pool():
+    with _opened_lock:
+        for conn in _opened:
+            conn.close()
+        _opened.clear()
+        _pools.clear()
+
+atexit.register(_close_pool)
@@ -1,11 +1,9 @@
 import sqlite3
 import datetime
-import hashlib
-from database import get_db_connection, create_user, create_ticket, get_user, get_all_agents, update_ticket, get_tickets
-
-def hash_password(password):
-    """Hashes a password using SHA256."""
-    return hashlib.sha256(password.encode()).hexdigest()
+from db.database import get_db_connection
+from db.users import create_users_bulk, get_user, get_all_agents
+from db.tickets import create_tickets_bulk, get_tickets
+from db.categories_priorities import is_valid_category, is_valid_priority
 
 def seed_data():
     """
@@ -24,19 +22,20 @@ def seed_data():
             ("peter_jones", "peter.jones@example.com", "password789", 'customer'),
         ]
         
+        new_customers = []
         for username, email, password, role in customer_data:
             if not get_user(email=email, conn=conn):
-                create_user(
-                    username=username,
-                    email=email,
-                    password_hash=hash_password(password),
-                    role=role,
-                    conn=conn
-                )
-                print(f"User '{username}' created.")
+                new_customers.append((username, email, password, role, 'active'))
             else:
                 print(f"User '{username}' already exists.")
 
+        # Missing customers are created in one transaction
+        if create_users_bulk(new_customers, conn=conn) is None:
+            print("Error: Could not create customer users. Aborting ticket seeding.")
+            return
+        for username, *_ in new_customers:
+            print(f"User '{username}' created.")
+
         # --- 2. Get User and Agent IDs ---
         print("Fetching user and agent IDs for ticket creation...")
         
@@ -55,13 +54,7 @@ def seed_data():
         agents = get_all_agents(conn=conn)
         if not agents:
             print("No agents found, creating one.")
-            create_user(
-                username="agent1",
-                email="agent1@example.com",
-                password_hash=hash_password("agent1pass"),
-                role='agent',
-                conn=conn
-            )
+            create_users_bulk([("agent1", "agent1@example.com", "agent1pass", 'agent', 'active')], conn=conn)
             agents = get_all_agents(conn=conn) # Refresh agent list
             if not agents: # Fallback if agent creation somehow failed
                 print("Critical Error: Failed to create agent.")
@@ -150,42 +143,52 @@ def seed_data():
         demo_tickets_data.extend(more_demo_tickets_data)
 
 
-        ticket_count = 0
+        new_tickets = []
         for i, ticket_data in enumerate(demo_tickets_data):
             # Check if a similar ticket already exists to avoid duplicates
             cursor.execute("SELECT id FROM tickets WHERE title = ? AND customer_id = ?", (ticket_data['title'], ticket_data['customer_id']))
-            existing_ticket_row = cursor.fetchone()
-
-            if existing_ticket_row is None:
-                # Assign agent in a round-robin fashion
-                agent_id = agent_ids[i % len(agent_ids)] if agent_ids and agent_ids[0] is not None else None
-
-                ticket_id = create_ticket(
-                    title=ticket_data['title'],
-                    description=ticket_data['description'],
-                    customer_id=ticket_data['customer_id'],
-                    category=ticket_data['category'],
-                    priority=ticket_data['priority'],
-                    conn=conn
-                )
-                if ticket_id:
-                    # Assign the ticket to an agent if it was just created and not already assigned
-                    if agent_id:
-                         # Use execute for direct update, as create_ticket doesn't take agent_id
-                         cursor.execute("UPDATE tickets SET agent_id = ? WHERE id = ? AND agent_id IS NULL", (agent_id, ticket_id))
-                    conn.commit() # Commit each ticket creation to ensure it's in DB for next step
-                    ticket_count += 1
-            else:
+            if cursor.fetchone() is not None:
                 print(f"Ticket '{ticket_data['title']}' for customer ID {ticket_data['customer_id']} already exists. Skipping creation.")
+                continue
+            # One invalid name would fail the whole bulk insert, so skip those tickets here
+            if not is_valid_category(ticket_data['category']) or not is_valid_priority(ticket_data['priority']):
+                print(f"Ticket '{ticket_data['title']}' has an unknown category or priority. Skipping creation.")
+                continue
+            new_tickets.append((i, ticket_data))
+
+        # All new tickets are inserted in one transaction
+        ticket_count = create_tickets_bulk(
+            [
+                (ticket_data['title'], ticket_data['description'], ticket_data['customer_id'],
+                 ticket_data['category'], ticket_data['priority'])
+                for _, ticket_data in new_tickets
+            ],
+            conn=conn
+        )
+        if ticket_count is None:
+            print("Error: Could not create demo tickets. Aborting ticket seeding.")
+            return
+
+        # Assign agents in a round-robin fashion, as create_tickets_bulk doesn't take agent_id
+        cursor.executemany(
+            "UPDATE tickets SET agent_id = ? WHERE title = ? AND customer_id = ? AND agent_id IS NULL",
+            [
+                (agent_ids[i % len(agent_ids)], ticket_data['title'], ticket_data['customer_id'])
+                for i, ticket_data in new_tickets
+            ]
+        )
+        conn.commit()
         
         # --- 4. Update a subset of tickets with resolved_at and status ---
         print("Updating a subset of tickets with resolved dates and statuses...")
         all_tickets = get_tickets() # Get all tickets, including newly created and existing ones
         
-        resolved_count = 0
+        resolutions = []
+        # Stored timestamps are naive UTC, like CURRENT_TIMESTAMP.
+        now_utc = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
         for i, ticket in enumerate(all_tickets):
             # To ensure the resolved_at is always after created_at
-            created_at_dt = datetime.datetime.strptime(ticket['created_at'], '%Y-%m-%d %H:%M:%S.%f')
+            created_at_dt = datetime.datetime.fromisoformat(ticket['created_at'])
 
             # Update some existing tickets to 'Resolved' or 'Closed' with varied resolved_at dates
             if i % 3 == 0 and ticket['status'] not in ['Resolved', 'Closed']: # Update approximately every third unresolved ticket
@@ -195,8 +198,8 @@ def seed_data():
                 resolved_date_candidate = created_at_dt + datetime.timedelta(days=resolution_delta_days, hours=(i%24))
                 
                 # Make sure the resolved_date is not in the future
-                if resolved_date_candidate > datetime.datetime.now():
-                    resolved_date_candidate = datetime.datetime.now() - datetime.timedelta(days=(i%5)+1)
+                if resolved_date_candidate > now_utc:
+                    resolved_date_candidate = now_utc - datetime.timedelta(days=(i%5)+1)
                     if resolved_date_candidate < created_at_dt: # Ensure it's still after created_at_dt
                         resolved_date_candidate = created_at_dt + datetime.timedelta(hours=1)
 
@@ -204,12 +207,17 @@ def seed_data():
                 # Choose status based on index for variety
                 status_to_set = 'Resolved' if i % 2 == 0 else 'Closed'
                 
-                if update_ticket(ticket['id'], status=status_to_set, resolved_at=resolved_date_candidate.strftime('%Y-%m-%d %H:%M:%S')):
-                    resolved_count += 1
-                else:
-                    print(f"Failed to update ticket ID {ticket['id']}.")
+                resolutions.append((status_to_set, resolved_date_candidate.strftime('%Y-%m-%d %H:%M:%S'), ticket['id']))
+
+        # update_ticket would stamp resolved_at with the current time, so the
+        # simulated resolution dates are written directly, in one statement
+        cursor.executemany(
+            "UPDATE tickets SET status = ?, resolved_at = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            resolutions
+        )
+        resolved_count = len(resolutions)
 
-        conn.commit() # Final commit for any pending changes (e.g. agent assignment updates, status updates)
+        conn.commit()
         print(f"Successfully created {ticket_count} new demo tickets and updated {resolved_count} existing ones with resolution data.")
 
     except sqlite3.Error as e:
@@ -1,7 +1,5 @@
 import sqlite3
-import datetime
-import pandas as pd
-from .database import get_db_connection
+from .pool import pooled_connection, read_dataframe
 from .activity_logs import log_activity # Assuming this module has been created
 
 # --- SLA Settings ---
@@ -10,7 +8,6 @@ def get_sla_settings():
     Retrieves SLA settings joined with priority names.
     Returns a DataFrame with priority_id, name, response_time_hours, resolution_time_hours.
     """
-    conn = get_db_connection()
     # Join with priorities to get names and ensure all priorities are represented
     query = """
     SELECT
@@ -23,32 +20,29 @@ def get_sla_settings():
     LEFT JOIN sla_settings s ON p.id = s.priority_id
     ORDER BY p.sort_order
     """
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
+    with pooled_connection() as conn:
+        return read_dataframe(conn, query)
 
 def update_sla_settings(settings_list, admin_id):
     """
     Updates multiple SLA settings at once.
     `settings_list` is a list of tuples: (priority_id, response_time, resolution_time)
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    now = datetime.datetime.now()
-    
-    # Use INSERT OR REPLACE to handle both new and existing SLA settings
+    # UPSERT handles both new and existing SLA settings, updating existing rows in place
     query = """
-    INSERT OR REPLACE INTO sla_settings (priority_id, response_time_hours, resolution_time_hours, updated_at)
-    VALUES (?, ?, ?, ?)
+    INSERT INTO sla_settings (priority_id, response_time_hours, resolution_time_hours, updated_at)
+    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(priority_id) DO UPDATE SET
+        response_time_hours = excluded.response_time_hours,
+        resolution_time_hours = excluded.resolution_time_hours,
+        updated_at = excluded.updated_at
     """
-    # Augment the list with the timestamp
-    data_to_insert = [(p_id, resp, reso, now) for p_id, resp, reso in settings_list]
-    try:
-        cursor.executemany(query, data_to_insert)
-        conn.commit()
-        log_activity(admin_id, "sla_updated", "sla_settings", None, f"SLA settings updated for {len(settings_list)} priorities.")
-        return cursor.rowcount > 0
-    except sqlite3.IntegrityError:
-        return False
-    finally:
-        conn.close()
\ No newline at end of file
+    with pooled_connection() as conn:
+        try:
+            cursor = conn.cursor()
+            cursor.executemany(query, settings_list)
+            conn.commit()
+            log_activity(admin_id, "sla_updated", "sla_settings", None, f"SLA settings updated for {len(settings_list)} priorities.", durable=True)
+            return cursor.rowcount > 0
+        except sqlite3.IntegrityError:
+            return False
\ No newline at end of file
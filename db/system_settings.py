@@ -1,26 +1,38 @@
 import sqlite3
-import datetime
-from .database import get_db_connection
+from functools import lru_cache
+from .pool import pooled_connection
 from .activity_logs import log_activity # Assuming this module has been created
 
 # --- System Settings ---
+# Settings are read on every SLA calculation and email send but only change
+# from the admin panel, so reads are cached per process and
+# update_system_settings clears the cache. Callers get a copy.
 def get_system_settings():
-    conn = get_db_connection()
     # Return as a dictionary
+    return dict(_get_system_settings_cached())
+
+@lru_cache(maxsize=1)
+def _get_system_settings_cached():
     settings = {}
-    for row in conn.execute("SELECT setting_key, setting_value FROM system_settings").fetchall():
-        settings[row['setting_key']] = row['setting_value']
-    conn.close()
+    with pooled_connection() as conn:
+        for row in conn.execute("SELECT setting_key, setting_value FROM system_settings").fetchall():
+            settings[row['setting_key']] = row['setting_value']
     return settings
 
 def update_system_setting(key, value, admin_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    now = datetime.datetime.now()
-    cursor.execute(
-        "INSERT OR REPLACE INTO system_settings (setting_key, setting_value, updated_at, updated_by) VALUES (?, ?, ?, ?)",
-        (key, value, now, admin_id)
-    )
-    conn.commit()
-    log_activity(admin_id, "setting_updated", "system_settings", None, f"Setting '{key}' updated.")
-    conn.close()
\ No newline at end of file
+    update_system_settings({key: value}, admin_id)
+
+def update_system_settings(settings, admin_id):
+    """Saves a dict of setting key -> value in one transaction."""
+    with pooled_connection() as conn:
+        # UPSERT updates an existing row in place rather than deleting and re-inserting it.
+        conn.executemany(
+            "INSERT INTO system_settings (setting_key, setting_value, updated_at, updated_by) VALUES (?, ?, CURRENT_TIMESTAMP, ?) "
+            "ON CONFLICT(setting_key) DO UPDATE SET setting_value = excluded.setting_value, "
+            "updated_at = excluded.updated_at, updated_by = excluded.updated_by",
+            [(key, value, admin_id) for key, value in settings.items()]
+        )
+        conn.commit()
+    _get_system_settings_cached.cache_clear()
+    for key in settings:
+        log_activity(admin_id, "setting_updated", "system_settings", None, f"Setting '{key}' updated.", durable=True)
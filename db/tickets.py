@@ -1,64 +1,138 @@
 import sqlite3
 import datetime
+from functools import lru_cache
 import pytz
-import pandas as pd
-from .database import get_db_connection
+from .pool import pooled_connection
 from .activity_logs import log_activity
+from .categories_priorities import is_valid_category, is_valid_priority, get_category_lookup, get_priority_lookup
 from email_utils import send_ticket_created_notification, send_ticket_assigned_notification, send_ticket_resolved_notification
 from sla_utils import get_business_hours_settings, calculate_sla_due_date, check_resolution_sla_status, check_response_sla_status
 
+# Sort key stored in tickets.priority_rank; unknown priorities sort last.
+PRIORITY_RANKS = {'Critical': 1, 'High': 2, 'Medium': 3, 'Low': 4}
+UNKNOWN_PRIORITY_RANK = 5
+
 # --- Ticket CRUD Functions ---
 def create_ticket(title, description, customer_id, category_name, priority_name, conn=None):
     """
     Creates a new support ticket.
-    Validates category and priority names against existing tables.
+    Validates category and priority names against the cached category and priority names.
     """
-    close_conn = False
-    if conn is None:
-        conn = get_db_connection()
-        close_conn = True
+    # Validate Category
+    if not is_valid_category(category_name):
+        print(f"Validation Error: Category '{category_name}' not found or is archived.")
+        return None # Category not found or archived
 
-    try:
-        cursor = conn.cursor()
-        now = datetime.datetime.now()
+    # Validate Priority
+    if priority_name and not is_valid_priority(priority_name):
+        print(f"Validation Error: Priority '{priority_name}' not found.")
+        return None # Priority not found
 
-        # Validate Category
-        cursor.execute("SELECT id FROM categories WHERE name = ? AND archived = 0", (category_name,))
-        if cursor.fetchone() is None:
-            print(f"Validation Error: Category '{category_name}' not found or is archived.")
-            return None # Category not found or archived
-
-        # Validate Priority
-        if priority_name:
-            cursor.execute("SELECT id FROM priorities WHERE name = ?", (priority_name,))
-            if cursor.fetchone() is None:
-                print(f"Validation Error: Priority '{priority_name}' not found.")
-                return None # Priority not found
-
-        cursor.execute(
-            """
-            INSERT INTO tickets (title, description, customer_id, category, priority, status, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, 'Open', ?, ?)
-            """,
-            (title, description, customer_id, category_name, priority_name, now, now)
-        )
-        ticket_id = cursor.lastrowid
-        conn.commit()
-        log_activity(customer_id, "ticket_created", "tickets", ticket_id, f"Ticket '{title}' created with category '{category_name}' and priority '{priority_name}'.")
-        
-        # --- Send Email Notification ---
+    with pooled_connection(conn) as conn:
         try:
-            send_ticket_created_notification(ticket_id)
-        except Exception as e:
-            print(f"Failed to send ticket creation email for ticket {ticket_id}: {e}")
+            cursor = conn.cursor()
+
+            cursor.execute(
+                """
+                INSERT INTO tickets (title, description, customer_id, category, priority, priority_rank, status, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, 'Open', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+                RETURNING id, title, category, priority, customer_id
+                """,
+                (title, description, customer_id, category_name, priority_name,
+                 PRIORITY_RANKS.get(priority_name, UNKNOWN_PRIORITY_RANK))
+            )
+            ticket = dict(cursor.fetchone())
+            ticket_id = ticket['id']
+            conn.commit()
+            log_activity(customer_id, "ticket_created", "tickets", ticket_id, f"Ticket '{title}' created with category '{category_name}' and priority '{priority_name}'.")
+        
+            # --- Send Email Notification ---
+            try:
+                send_ticket_created_notification(ticket_id, ticket=ticket)
+            except Exception as e:
+                print(f"Failed to send ticket creation email for ticket {ticket_id}: {e}")
+
+            return ticket_id
+        except sqlite3.Error as e:
+            print(f"Database error in create_ticket: {e}")
+            return None
+
+def create_tickets_bulk(tickets, user_id_for_log=None, conn=None):
+    """
+    Creates many tickets in one transaction with a single prepared INSERT.
+    `tickets` is an iterable of (title, description, customer_id, category, priority)
+    tuples. Category and priority names are validated like create_ticket, and
+    no rows are written if any fails. No per-ticket notification emails are sent.
+    Returns the number of tickets created, or None on validation or database error.
+    """
+    tickets = list(tickets)
+    if not tickets:
+        return 0
+    for _, _, _, category_name, priority_name in tickets:
+        if not is_valid_category(category_name):
+            print(f"Validation Error: Category '{category_name}' not found or is archived.")
+            return None
+        if priority_name and not is_valid_priority(priority_name):
+            print(f"Validation Error: Priority '{priority_name}' not found.")
+            return None
 
-        return ticket_id
-    except sqlite3.Error as e:
-        print(f"Database error in create_ticket: {e}")
-        return None
-    finally:
-        if close_conn and conn:
-            conn.close()
+    with pooled_connection(conn) as conn:
+        try:
+            cursor = conn.cursor()
+            cursor.executemany(
+                """
+                INSERT INTO tickets (title, description, customer_id, category, priority, priority_rank, status, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, 'Open', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+                """,
+                [
+                    (title, description, customer_id, category_name, priority_name,
+                     PRIORITY_RANKS.get(priority_name, UNKNOWN_PRIORITY_RANK))
+                    for title, description, customer_id, category_name, priority_name in tickets
+                ]
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"Database error in create_tickets_bulk: {e}")
+            return None
+    log_activity(user_id_for_log, "tickets_bulk_created", "tickets", None, f"{len(tickets)} tickets created in bulk.")
+    return len(tickets)
+
+_TICKET_FILTER_KEYS = ('status', 'priority', 'category')
+_TICKET_ORDER_BY = {
+    'created_at DESC': 't.created_at DESC',
+    'created_at ASC': 't.created_at ASC',
+    'updated_at DESC': 't.updated_at DESC',
+    'updated_at ASC': 't.updated_at ASC',
+}
+
+@lru_cache(maxsize=None)
+def _tickets_query(scope, filter_keys, order_by):
+    """
+    SQL for one get_tickets shape: the role scope ('customer', 'agent',
+    'agent_or_unassigned' or None), the UI filters present and the sort.
+    Built once per shape so repeat calls reuse the same statement text.
+    """
+    # Category and priority details come from the cached lookups in
+    # get_tickets rather than being joined onto every ticket row.
+    query = """
+        SELECT
+            t.*,
+            c.username as customer_name,
+            a.username as agent_name
+        FROM tickets t
+        JOIN users c ON t.customer_id = c.id
+        LEFT JOIN users a ON t.agent_id = a.id
+    """
+    conditions = {
+        'customer': ["t.customer_id = ?"],
+        'agent': ["t.agent_id = ?"],
+        'agent_or_unassigned': ["(t.agent_id = ? OR t.agent_id IS NULL)"],
+    }.get(scope, [])
+    conditions += [f"t.{key} = ?" for key in filter_keys]
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return query + f" ORDER BY {order_by}"
 
 def get_tickets(customer_id=None, agent_id=None, include_unassigned=False, filters=None, order_by=None):
     """
@@ -71,83 +145,52 @@ def get_tickets(customer_id=None, agent_id=None, include_unassigned=False, filte
     - For agents/admins, includes SLA information.
     Returns a list of dictionaries.
     """
-    conn = get_db_connection()
     is_customer = customer_id is not None
-    try:
-        query = """
-            SELECT
-                t.*,
-                c.username as customer_name,
-                a.username as agent_name,
-                c_obj.id as category_id,
-                c_obj.description as category_description,
-                c_obj.color as category_color,
-                p_obj.id as priority_id,
-                p_obj.description as priority_description,
-                p_obj.color as priority_color,
-                p_obj.sort_order as priority_sort_order
-        """
-        if not is_customer:
-            query += """,
-                sla.response_time_hours,
-                sla.resolution_time_hours
-            """
-
-        query += """
-            FROM tickets t
-            JOIN users c ON t.customer_id = c.id
-            LEFT JOIN users a ON t.agent_id = a.id
-            LEFT JOIN categories c_obj ON t.category = c_obj.name
-            LEFT JOIN priorities p_obj ON t.priority = p_obj.name
-        """
-        if not is_customer:
-            query += " LEFT JOIN sla_settings sla ON p_obj.id = sla.priority_id"
+    params = []
 
-        params = []
-        conditions = []
-
-        # Role-based base filtering
-        if customer_id:
-            conditions.append("t.customer_id = ?")
-            params.append(customer_id)
-        elif agent_id:
-            if include_unassigned:
-                conditions.append("(t.agent_id = ? OR t.agent_id IS NULL)")
-                params.append(agent_id)
-            else:
-                conditions.append("t.agent_id = ?")
-                params.append(agent_id)
-
-        # Apply additional filters from UI
-        if filters:
-            allowed_filter_keys = ['status', 'priority', 'category']
-            for key, value in filters.items():
-                if key in allowed_filter_keys and value:
-                    conditions.append(f"t.{key} = ?")
-                    params.append(value)
-
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-
-        # Apply sorting
-        if order_by:
-            allowed_order_by = {
-                'created_at DESC': 't.created_at DESC',
-                'created_at ASC': 't.created_at ASC',
-                'updated_at DESC': 't.updated_at DESC',
-                'updated_at ASC': 't.updated_at ASC',
-            }
-            if order_by in allowed_order_by:
-                 query += f" ORDER BY {allowed_order_by[order_by]}"
-            else:
-                query += " ORDER BY t.updated_at DESC"
-        else:
-            query += " ORDER BY t.updated_at DESC"
+    # Role-based base filtering
+    scope = None
+    if customer_id:
+        scope = 'customer'
+        params.append(customer_id)
+    elif agent_id:
+        scope = 'agent_or_unassigned' if include_unassigned else 'agent'
+        params.append(agent_id)
+
+    # Apply additional filters from UI, in a fixed order
+    filter_keys = tuple(key for key in _TICKET_FILTER_KEYS if filters and filters.get(key))
+    params.extend(filters[key] for key in filter_keys)
+
+    query = _tickets_query(scope, filter_keys, _TICKET_ORDER_BY.get(order_by, 't.updated_at DESC'))
 
+    with pooled_connection() as conn:
         cursor = conn.cursor()
         cursor.execute(query, tuple(params))
         tickets = [dict(row) for row in cursor.fetchall()]
 
+        if not is_customer:
+            sla_by_priority = {
+                row['priority_id']: row
+                for row in conn.execute("SELECT priority_id, response_time_hours, resolution_time_hours FROM sla_settings")
+            }
+
+        categories = get_category_lookup()
+        priorities = get_priority_lookup()
+        for ticket in tickets:
+            category = categories.get(ticket['category'], {})
+            ticket['category_id'] = category.get('id')
+            ticket['category_description'] = category.get('description')
+            ticket['category_color'] = category.get('color')
+            priority = priorities.get(ticket['priority'], {})
+            ticket['priority_id'] = priority.get('id')
+            ticket['priority_description'] = priority.get('description')
+            ticket['priority_color'] = priority.get('color')
+            ticket['priority_sort_order'] = priority.get('sort_order')
+            if not is_customer:
+                sla = sla_by_priority.get(ticket['priority_id'])
+                ticket['response_time_hours'] = sla['response_time_hours'] if sla else None
+                ticket['resolution_time_hours'] = sla['resolution_time_hours'] if sla else None
+
         if not is_customer:
             sla_settings = get_business_hours_settings()
             for ticket in tickets:
@@ -163,8 +206,6 @@ def get_tickets(customer_id=None, agent_id=None, include_unassigned=False, filte
                 ticket['response_due'] = response_due.isoformat() if response_due else None
                 ticket['response_status'] = check_response_sla_status(ticket, response_due)
         return tickets
-    finally:
-        conn.close()
 
 def update_ticket(ticket_id, user_id_for_log=None, **kwargs):
     """
@@ -173,109 +214,95 @@ def update_ticket(ticket_id, user_id_for_log=None, **kwargs):
     `kwargs` can contain: status, agent_id, category, priority.
     Validates category and priority names if they are being updated.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    # Validate category and priority if they are in kwargs
+    if 'category' in kwargs and not is_valid_category(kwargs['category']):
+        print(f"Validation Error: Category '{kwargs['category']}' not found or is archived for ticket update.")
+        return False
 
-    # Get old agent_id and status for email notification logic
-    cursor.execute("SELECT agent_id, status FROM tickets WHERE id = ?", (ticket_id,))
-    row = cursor.fetchone()
-    old_agent_id = row['agent_id'] if row else None
-    old_status = row['status'] if row else None
+    if 'priority' in kwargs and not is_valid_priority(kwargs['priority']):
+        print(f"Validation Error: Priority '{kwargs['priority']}' not found for ticket update.")
+        return False
 
-    allowed_fields = ['status', 'agent_id', 'category', 'priority']
-    updates = []
-    params = []
-    now = datetime.datetime.now()
-    details_for_log = []
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
 
-    # Validate category and priority if they are in kwargs
-    if 'category' in kwargs:
-        category_name = kwargs['category']
-        cursor.execute("SELECT id FROM categories WHERE name = ? AND archived = 0", (category_name,))
-        if cursor.fetchone() is None:
-            print(f"Validation Error: Category '{category_name}' not found or is archived for ticket update.")
-            conn.close()
-            return False
-        
-    if 'priority' in kwargs:
-        priority_name = kwargs['priority']
-        cursor.execute("SELECT id FROM priorities WHERE name = ?", (priority_name,))
-        if cursor.fetchone() is None:
-            print(f"Validation Error: Priority '{priority_name}' not found for ticket update.")
-            conn.close()
-            return False
+        # Get old agent_id and status for email notification logic, and
+        # resolved_at so it is only set the first time a ticket is resolved
+        cursor.execute("SELECT agent_id, status, resolved_at FROM tickets WHERE id = ?", (ticket_id,))
+        row = cursor.fetchone()
+        old_agent_id = row['agent_id'] if row else None
+        old_status = row['status'] if row else None
+        old_resolved_at = row['resolved_at'] if row else None
 
-    for key, value in kwargs.items():
-        if key in allowed_fields:
-            updates.append(f"{key} = ?")
-            params.append(value)
-            details_for_log.append(f"{key} to '{value}'")
-            if key == 'status' and value in ['Resolved', 'Closed']:
-                # Only set resolved_at if it is not already set
-                cursor.execute("SELECT resolved_at FROM tickets WHERE id = ?", (ticket_id,))
-                if cursor.fetchone()['resolved_at'] is None:
-                    updates.append("resolved_at = ?")
-                    params.append(now)
-
-    if not updates:
-        conn.close()
-        return True # Nothing to update, but operation is successful
-
-    updates.append("updated_at = ?")
-    params.append(now)
-    params.append(ticket_id)
-
-    query = f"UPDATE tickets SET {', '.join(updates)} WHERE id = ?"
-
-    try:
-        cursor.execute(query, tuple(params))
-        conn.commit()
-        if cursor.rowcount > 0:
-            log_activity(user_id_for_log, "ticket_updated", "tickets", ticket_id, f"Updated ticket: {', '.join(details_for_log)}.")
-            
-            # --- Send Email Notification on Assignment ---
-            if 'agent_id' in kwargs and kwargs['agent_id'] is not None and kwargs['agent_id'] != old_agent_id:
-                try:
-                    send_ticket_assigned_notification(ticket_id)
-                except Exception as e:
-                    print(f"Failed to send ticket assignment email for ticket {ticket_id}: {e}")
-            # --- End Email ---
-
-            # --- Send Email Notification on Resolution ---
-            if 'status' in kwargs and kwargs['status'] == 'Resolved' and old_status != 'Resolved':
-                try:
-                    send_ticket_resolved_notification(ticket_id)
-                except Exception as e:
-                    print(f"Failed to send ticket resolved email for ticket {ticket_id}: {e}")
-            # --- End Email ---
+        allowed_fields = ['status', 'agent_id', 'category', 'priority']
+        updates = []
+        params = []
+        details_for_log = []
 
-            return True
-        return False # No row was updated
-    except sqlite3.Error as e:
-        print(f"Database error on ticket update: {e}")
-        return False
-    finally:
-        conn.close()
+        for key, value in kwargs.items():
+            if key in allowed_fields:
+                updates.append(f"{key} = ?")
+                params.append(value)
+                details_for_log.append(f"{key} to '{value}'")
+                if key == 'priority':
+                    updates.append("priority_rank = ?")
+                    params.append(PRIORITY_RANKS.get(value, UNKNOWN_PRIORITY_RANK))
+                if key == 'status' and value in ['Resolved', 'Closed']:
+                    # Only set resolved_at if it is not already set
+                    if old_resolved_at is None:
+                        updates.append("resolved_at = CURRENT_TIMESTAMP")
+
+        if not updates:
+            return True # Nothing to update, but operation is successful
+
+        updates.append("updated_at = CURRENT_TIMESTAMP")
+        params.append(ticket_id)
+
+        query = f"UPDATE tickets SET {', '.join(updates)} WHERE id = ?"
+
+        try:
+            cursor.execute(query, tuple(params))
+            conn.commit()
+            if cursor.rowcount > 0:
+                log_activity(user_id_for_log, "ticket_updated", "tickets", ticket_id, f"Updated ticket: {', '.join(details_for_log)}.")
+            
+                # --- Send Email Notification on Assignment ---
+                if 'agent_id' in kwargs and kwargs['agent_id'] is not None and kwargs['agent_id'] != old_agent_id:
+                    try:
+                        send_ticket_assigned_notification(ticket_id)
+                    except Exception as e:
+                        print(f"Failed to send ticket assignment email for ticket {ticket_id}: {e}")
+                # --- End Email ---
+
+                # --- Send Email Notification on Resolution ---
+                if 'status' in kwargs and kwargs['status'] == 'Resolved' and old_status != 'Resolved':
+                    try:
+                        send_ticket_resolved_notification(ticket_id)
+                    except Exception as e:
+                        print(f"Failed to send ticket resolved email for ticket {ticket_id}: {e}")
+                # --- End Email ---
+
+                return True
+            return False # No row was updated
+        except sqlite3.Error as e:
+            print(f"Database error on ticket update: {e}")
+            return False
 
 def delete_ticket(ticket_id, user_id_for_log=None):
     """Deletes a ticket from the database."""
-    conn = get_db_connection()
-    try:
+    with pooled_connection() as conn:
         cursor = conn.cursor()
         # We might want to add checks here later (e.g., only closed tickets can be deleted)
         cursor.execute("DELETE FROM tickets WHERE id = ?", (ticket_id,))
         conn.commit()
         if cursor.rowcount > 0:
-            log_activity(user_id_for_log, "ticket_deleted", "tickets", ticket_id, f"Ticket ID {ticket_id} deleted.")
+            log_activity(user_id_for_log, "ticket_deleted", "tickets", ticket_id, f"Ticket ID {ticket_id} deleted.", durable=True)
             return True
         return False
-    finally:
-        conn.close()
             
 def get_ticket_counts_by_category():
     """Retrieves the count of tickets for each category."""
-    conn = get_db_connection()
-    try:
+    with pooled_connection() as conn:
         query = """
             SELECT
                 category,
@@ -287,11 +314,8 @@ def get_ticket_counts_by_category():
         cursor = conn.cursor()
         cursor.execute(query)
         return {row['category']: row['ticket_count'] for row in cursor.fetchall()}
-    finally:
-        conn.close()
 
 def get_ticket_by_id(ticket_id):
-    conn = get_db_connection()
     # Join with users, categories, and priorities to get all names and details
     query = """
     SELECT
@@ -312,28 +336,27 @@ def get_ticket_by_id(ticket_id):
     LEFT JOIN priorities p_obj ON t.priority = p_obj.name
     WHERE t.id = ?
     """
-    row = conn.execute(query, (ticket_id,)).fetchone()
-    conn.close()
+    with pooled_connection() as conn:
+        row = conn.execute(query, (ticket_id,)).fetchone()
     return dict(row) if row else None
 
 def get_tickets_for_reassignment():
-    conn = get_db_connection()
+    """Open tickets as a list of dicts with 'id', 'title' and 'agent_name'."""
     query = """
     SELECT t.id, t.title, a.username as agent_name
     FROM tickets t
     LEFT JOIN users a ON t.agent_id = a.id
     WHERE t.status NOT IN ('Resolved', 'Closed')
     """
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
-    
+    with pooled_connection() as conn:
+        return [dict(row) for row in conn.execute(query).fetchall()]
+
 def reassign_ticket(ticket_id, new_agent_id, admin_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE tickets SET agent_id = ? WHERE id = ?", (new_agent_id, ticket_id))
-    conn.commit()
-    log_activity(admin_id, "ticket_reassigned", "tickets", ticket_id, f"Ticket reassigned to agent ID {new_agent_id}.")
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE tickets SET agent_id = ? WHERE id = ?", (new_agent_id, ticket_id))
+        conn.commit()
+    log_activity(admin_id, "ticket_reassigned", "tickets", ticket_id, f"Ticket reassigned to agent ID {new_agent_id}.", durable=True)
     
     # --- Send Email Notification ---
     if new_agent_id is not None:
@@ -343,5 +366,4 @@ def reassign_ticket(ticket_id, new_agent_id, admin_id):
             print(f"Failed to send ticket reassignment email for ticket {ticket_id}: {e}")
     # --- End Email ---
 
-    conn.close()
     return cursor.rowcount > 0
@@ -1,148 +1,201 @@
+import os
 import sqlite3
-import hashlib
-import pandas as pd
-from .database import get_db_connection
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from .pool import pooled_connection, read_dataframe
+from auth_utils import hash_password
 from .activity_logs import log_activity # Assuming this module will be created and contain log_activity
 
 # --- User CRUD Functions (including Admin) ---
 
 def create_user(username, email, password, role='customer', status='active', conn=None):
     """Creates a new user in the database."""
-    close_conn = False
-    if conn is None:
-        conn = get_db_connection()
-        close_conn = True
-    try:
-        cursor = conn.cursor()
-        password_hash = hashlib.sha256(password.encode()).hexdigest()
-        cursor.execute(
-            "INSERT INTO users (username, email, password_hash, role, status) VALUES (?, ?, ?, ?, ?)",
-            (username, email, password_hash, role, status)
-        )
-        user_id = cursor.lastrowid
-        conn.commit()
-        log_activity(None, "user_created", "users", user_id, f"User '{username}' created with role '{role}'.")
-        return user_id
-    except sqlite3.IntegrityError:
-        return None
-    finally:
-        if close_conn: conn.close()
+    with pooled_connection(conn) as conn:
+        try:
+            cursor = conn.cursor()
+            password_hash = hash_password(password)
+            # A taken username or email inserts nothing and returns no row.
+            cursor.execute(
+                "INSERT INTO users (username, email, password_hash, role, status) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT DO NOTHING RETURNING id",
+                (username, email, password_hash, role, status)
+            )
+            row = cursor.fetchone()
+            conn.commit()
+            if row is None:
+                return None
+            user_id = row[0]
+            _clear_user_caches()
+            log_activity(None, "user_created", "users", user_id, f"User '{username}' created with role '{role}'.")
+            return user_id
+        except sqlite3.IntegrityError:
+            return None # e.g. a role or status outside the CHECK constraint
+
+def create_users_bulk(users, conn=None):
+    """
+    Creates many users in one transaction with a single prepared INSERT.
+    `users` is an iterable of (username, email, password, role, status) tuples.
+    Returns the number of users created, or None if any row violates a
+    uniqueness or CHECK constraint (in which case none are created).
+    """
+    users = list(users)
+    if not users:
+        return 0
+    # PBKDF2 runs in OpenSSL with the GIL released, so hash across cores.
+    with ThreadPoolExecutor(max_workers=min(len(users), os.cpu_count() or 1)) as executor:
+        password_hashes = list(executor.map(hash_password, [user[2] for user in users]))
+    rows = [
+        (username, email, password_hash, role, status)
+        for (username, email, _, role, status), password_hash in zip(users, password_hashes)
+    ]
+    with pooled_connection(conn) as conn:
+        try:
+            cursor = conn.cursor()
+            cursor.executemany(
+                "INSERT INTO users (username, email, password_hash, role, status) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.commit()
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            return None
+    _clear_user_caches()
+    log_activity(None, "users_bulk_created", "users", None, f"{len(rows)} users created in bulk.")
+    return len(rows)
 
 def get_user(user_id=None, email=None, username=None, conn=None):
-    """Retrieves a user by their ID, email, or username."""
-    close_conn = False
+    """
+    Retrieves a user by their ID, email, or username.
+    Lookups without a caller-supplied connection are cached per process;
+    user create/update/delete paths clear the cache.
+    """
     if conn is None:
-        conn = get_db_connection()
-        close_conn = True
-    try:
-        cursor = conn.cursor()
-        if user_id:
-            cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
-        elif email:
-            cursor.execute("SELECT * FROM users WHERE email = ?", (email,))
-        elif username:
-            cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
-        else:
-            return None
-        user_row = cursor.fetchone()
-        return dict(user_row) if user_row else None
-    finally:
-        if close_conn: conn.close()
-        
+        user = _get_user_cached(user_id, email, username)
+        return dict(user) if user else None
+    return _fetch_user(conn, user_id, email, username)
+
+USER_COLUMNS = "id, username, email, password_hash, role, status, created_at"
+
+# One canonical string per lookup, so every call hits the connection's statement cache.
+_Q_USER_BY = {
+    column: f"SELECT {USER_COLUMNS} FROM users WHERE {column} = ?"
+    for column in ("id", "email", "username")
+}
+
+def _fetch_user(conn, user_id, email, username):
+    if user_id:
+        column, value = "id", user_id
+    elif email:
+        column, value = "email", email
+    elif username:
+        column, value = "username", username
+    else:
+        return None
+    query = _Q_USER_BY[column]
+    with pooled_connection(conn) as conn:
+        user_row = conn.execute(query, (value,)).fetchone()
+    return dict(user_row) if user_row else None
+
+@lru_cache(maxsize=1024)
+def _get_user_cached(user_id, email, username):
+    return _fetch_user(None, user_id, email, username)
+
+@lru_cache(maxsize=256)
+def get_user_role(user_id):
+    """
+    Returns a user's role, or None if there is no such user.
+    Cached per process; user create/update/delete paths clear the cache.
+    """
+    with pooled_connection() as conn:
+        row = conn.execute("SELECT role FROM users WHERE id = ?", (user_id,)).fetchone()
+    return row['role'] if row else None
+
+def _clear_user_caches():
+    get_user_role.cache_clear()
+    _get_user_cached.cache_clear()
+
 def get_all_users():
     """Retrieves all users for the admin panel."""
-    conn = get_db_connection()
-    df = pd.read_sql_query("SELECT id, username, email, role, status, created_at FROM users", conn)
-    conn.close()
-    return df
+    with pooled_connection() as conn:
+        return read_dataframe(conn, "SELECT id, username, email, role, status, created_at FROM users")
 
 def update_user_admin(user_id, username, email, role, status):
     """Updates a user's details from the admin panel."""
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE users SET username = ?, email = ?, role = ?, status = ? WHERE id = ?",
-            (username, email, role, status, user_id)
-        )
-        conn.commit()
-        log_activity(None, "user_updated", "users", user_id, f"User ID {user_id} details updated.")
-        return cursor.rowcount > 0
-    except sqlite3.IntegrityError:
-        return False # Unique constraint failed
-    finally:
-        conn.close()
+    with pooled_connection() as conn:
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE users SET username = ?, email = ?, role = ?, status = ? WHERE id = ?",
+                (username, email, role, status, user_id)
+            )
+            conn.commit()
+            _clear_user_caches()
+            log_activity(None, "user_updated", "users", user_id, f"User ID {user_id} details updated.", durable=True)
+            return cursor.rowcount > 0
+        except sqlite3.IntegrityError:
+            return False # Unique constraint failed
 
 def delete_user(user_id):
     """Deletes a user if they have no associated tickets."""
-    conn = get_db_connection()
-    try:
+    with pooled_connection() as conn:
         cursor = conn.cursor()
-        # Check for associated tickets as customer or agent
-        cursor.execute("SELECT 1 FROM tickets WHERE customer_id = ? OR agent_id = ? LIMIT 1", (user_id, user_id))
-        if cursor.fetchone():
-            return "has_tickets" # Cannot delete user with tickets
-        
-        cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
+        # Delete only if the user has no tickets as customer or agent. Two
+        # NOT EXISTS probes let each side use its (customer_id|agent_id, created_at) index.
+        cursor.execute(
+            "DELETE FROM users WHERE id = ? "
+            "AND NOT EXISTS (SELECT 1 FROM tickets WHERE customer_id = ?) "
+            "AND NOT EXISTS (SELECT 1 FROM tickets WHERE agent_id = ?)",
+            (user_id, user_id, user_id)
+        )
         conn.commit()
         if cursor.rowcount > 0:
-            log_activity(None, "user_deleted", "users", user_id, f"User ID {user_id} deleted.")
+            _clear_user_caches()
+            log_activity(None, "user_deleted", "users", user_id, f"User ID {user_id} deleted.", durable=True)
             return True
+        # Nothing deleted: either the user has tickets or does not exist.
+        cursor.execute("SELECT 1 FROM users WHERE id = ?", (user_id,))
+        if cursor.fetchone():
+            return "has_tickets" # Cannot delete user with tickets
         return False
-    finally:
-        conn.close()
 
 def update_password_hash(user_id, new_password):
     """Updates a user's password hash."""
-    conn = get_db_connection()
-    try:
+    new_password_hash = hash_password(new_password)
+    with pooled_connection() as conn:
         cursor = conn.cursor()
-        new_password_hash = hashlib.sha256(new_password.encode()).hexdigest()
         cursor.execute( "UPDATE users SET password_hash = ? WHERE id = ?", (new_password_hash, user_id) )
         conn.commit()
+        _clear_user_caches()
         return cursor.rowcount > 0
-    finally:
-        conn.close()
 
 def get_all_agents(conn=None):
-    close_conn = False
-    if conn is None:
-        conn = get_db_connection()
-        close_conn = True
-    try:
-        return pd.read_sql("SELECT id, username FROM users WHERE role = 'agent' AND status = 'active'", conn)
-    finally:
-        if close_conn: conn.close()
+    """Retrieves all active agents as a list of dicts with 'id' and 'username'."""
+    with pooled_connection(conn) as conn:
+        cursor = conn.execute("SELECT id, username FROM users WHERE role = 'agent' AND status = 'active'")
+        return [dict(row) for row in cursor.fetchall()]
 
 def get_all_customers(conn=None):
     """Retrieves all users with the 'customer' role."""
-    close_conn = False
-    if conn is None:
-        conn = get_db_connection()
-        close_conn = True
-    try:
+    with pooled_connection(conn) as conn:
         # Returns a list of dicts to be compatible with UI components
         cursor = conn.cursor()
         cursor.execute("SELECT id, username FROM users WHERE role = 'customer' AND status = 'active' ORDER BY username")
         return [dict(row) for row in cursor.fetchall()]
-    finally:
-        if close_conn: conn.close()
 
 def update_user(user_id, username, email):
     """Updates a user's own username and email. Not for admin use."""
-    conn = get_db_connection()
-    try:
-        cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE users SET username = ?, email = ? WHERE id = ?",
-            (username, email, user_id)
-        )
-        conn.commit()
-        if cursor.rowcount > 0:
-            log_activity(user_id, "profile_updated", "users", user_id, "User updated their own profile.")
-            return True
-        return True # Return True even if no rows changed
-    except sqlite3.IntegrityError:
-        return False # Unique constraint failed
-    finally:
-        conn.close()
+    with pooled_connection() as conn:
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE users SET username = ?, email = ? WHERE id = ?",
+                (username, email, user_id)
+            )
+            conn.commit()
+            _clear_user_caches()
+            if cursor.rowcount > 0:
+                log_activity(user_id, "profile_updated", "users", user_id, "User updated their own profile.")
+                return True
+            return True # Return True even if no rows changed
+        except sqlite3.IntegrityError:
+            return False # Unique constraint failed
@@ -83,12 +83,15 @@ def send_email(to_email, subject, body_html, body_text=None):
         # Here we could log the error to a database or file
         return False
 
-def send_ticket_created_notification(ticket_id):
+def send_ticket_created_notification(ticket_id, ticket=None):
     """
     Fetches ticket data and sends a 'ticket created' notification to the customer.
+    `ticket` may be passed by callers that already hold the row (id, title,
+    category, priority, customer_id) to skip the lookup.
     """
-    from db.tickets import get_ticket_by_id
-    ticket = get_ticket_by_id(ticket_id)
+    if ticket is None:
+        from db.tickets import get_ticket_by_id
+        ticket = get_ticket_by_id(ticket_id)
     if not ticket:
         print(f"Cannot send creation notification: Ticket ID {ticket_id} not found.")
         return
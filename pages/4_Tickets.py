@@ -1,6 +1,5 @@
 import streamlit as st
 from db.tickets import get_tickets, update_ticket, delete_ticket
-from db.users import get_user
 from auth_utils import render_sidebar
 from sla_utils import get_business_hours_settings
 import datetime
@@ -99,8 +98,8 @@ if all_tickets:
     for ticket in all_tickets:
         cols = st.columns(column_weights)
         
-        customer_info = get_user(user_id=ticket['customer_id'])
-        customer_name = customer_info['username'] if customer_info else "Unknown"
+        # get_tickets already joins the customer's username onto each row
+        customer_name = ticket.get('customer_name') or "Unknown"
 
         # --- Common columns for all roles ---
         cols[0].write(f"**#{ticket['id']}**")
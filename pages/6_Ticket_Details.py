@@ -1,6 +1,6 @@
 import streamlit as st
 from db.tickets import update_ticket, get_ticket_by_id
-from db.users import get_user, get_all_agents
+from db.users import get_all_agents
 from db.categories_priorities import get_priorities
 from datetime import datetime
 from auth_utils import render_sidebar
@@ -37,8 +37,7 @@ st.subheader(f"Ticket #{ticket['id']} - {ticket['title']}")
 
 col1, col2, col3 = st.columns(3)
 with col1:
-    customer_info = get_user(user_id=ticket['customer_id'])
-    st.markdown(f"**Customer:** {customer_info['username'] if customer_info else 'Unknown'}")
+    st.markdown(f"**Customer:** {ticket['customer_name'] or 'Unknown'}")
     if st.markdown(f"**Status:** {ticket['status']}") and ticket['status'] in ['Resolved', 'Closed']:
         st.markdown(f"**Resolved At:** {ticket['resolved_at']}")
     st.markdown(f"**Priority:** {ticket['priority']}")
@@ -47,8 +46,7 @@ with col2:
     st.markdown(f"**Created At:** {ticket['created_at']}")
     st.markdown(f"**Updated At:** {ticket['updated_at']}")
 with col3:
-    assigned_agent_info = get_user(user_id=ticket['agent_id'])
-    st.markdown(f"**Assigned To:** {assigned_agent_info['username'] if assigned_agent_info else 'Unassigned'}")
+    st.markdown(f"**Assigned To:** {ticket['agent_name'] or 'Unassigned'}")
 
 st.markdown("---")
 st.subheader("Description")
@@ -62,15 +60,13 @@ if st.session_state['user']['role'] in ['agent', 'admin']:
 
     with st.form("update_ticket_form"):
         new_status = st.selectbox("Update Status", ['Open', 'In Progress', 'Resolved', 'Closed'], index=['Open', 'In Progress', 'Resolved', 'Closed'].index(ticket['status']))
-        priority = st.selectbox("Priority", [priorities_df['name'] for _, priorities_df in get_priorities().iterrows()])
+        priority = st.selectbox("Priority", get_priorities()['name'].tolist())
         
         if st.session_state['user']['role'] == 'admin':
             agents = get_all_agents()
-            # Correctly iterate over DataFrame rows to create options
-            agent_options = {row['username']: row['id'] for index, row in agents.iterrows()}
+            agent_options = {row['username']: row['id'] for row in agents}
             
-            current_assigned_agent = get_user(user_id=ticket['agent_id'])
-            current_assigned_username = current_assigned_agent['username'] if current_assigned_agent else "Unassigned"
+            current_assigned_username = ticket['agent_name'] or "Unassigned"
 
             # Create a list of usernames for the selectbox
             agent_usernames = ["Unassigned"] + list(agent_options.keys())
@@ -4,17 +4,14 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px # type: ignore
 import plotly.graph_objects as go # type: ignore
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from db.analytics_helpers import (
     calculate_average_resolution_time,
     get_tickets_for_analytics,
     get_status_breakdown_per_category,
-    get_resolution_time_by_category,
-    get_resolution_time_by_priority,
-    get_created_vs_resolved_trends,
     get_open_ticket_age_distribution,
-    get_agent_performance_metrics,
-    get_top_keywords
+    get_top_keywords,
+    dashboard_bundle
 )
 from auth_utils import render_sidebar
 
@@ -81,7 +78,8 @@ PRIORITY_COLORS = {
 with st.expander("Filters", expanded=True):
     col1, col2 = st.columns(2)
     with col1:
-        today = datetime.now()
+        # Ticket timestamps are stored in UTC, so the default range uses the UTC date.
+        today = datetime.now(timezone.utc).date()
         start_date = st.date_input("Start Date", today - timedelta(days=30))
     with col2:
         end_date = st.date_input("End Date", today)
@@ -96,6 +94,13 @@ with st.expander("Filters", expanded=True):
         st.warning("No ticket data available for the selected date range and your permissions.")
         st.stop()
 
+    with st.spinner("Fetching dashboard data..."):
+        # Results for the date-range sections below, fetched in one call.
+        dashboard_data = dashboard_bundle(
+            start_date_str, end_date_str, user_id=user_id,
+            include_agent_performance=(user_role == 'admin')
+        )
+
     category_options = all_tickets_df['category'].unique().tolist()
     priority_options = all_tickets_df['priority'].unique().tolist()
     status_options = all_tickets_df['status'].unique().tolist()
@@ -142,7 +147,8 @@ with st.expander("Ticket Status & Trends", expanded=False):
     with col1:
         st.subheader("Status Breakdown by Category")
         with st.spinner("Loading Status Breakdown..."):
-            status_breakdown_df = get_status_breakdown_per_category(filtered_df)
+            # The filtered tickets are already in memory; no query needed.
+            status_breakdown_df = get_status_breakdown_per_category(df=filtered_df)
         if not status_breakdown_df.empty:
             fig = px.bar(
                 status_breakdown_df,
@@ -200,7 +206,7 @@ with st.expander("Resolution & Performance Metrics", expanded=False):
     with col1:
         st.subheader("Average Resolution Time by Category")
         with st.spinner("Loading Resolution Time by Category..."):
-            resolution_by_cat_df = get_resolution_time_by_category(start_date_str, end_date_str, user_id=user_id)
+            resolution_by_cat_df = dashboard_data['resolution_by_category']
         if not resolution_by_cat_df.empty:
             fig = px.bar(
                 resolution_by_cat_df,
@@ -226,7 +232,7 @@ with st.expander("Resolution & Performance Metrics", expanded=False):
     with col2:
         st.subheader("Average Resolution Time by Priority")
         with st.spinner("Loading Resolution Time by Priority..."):
-            resolution_by_prio_df = get_resolution_time_by_priority(start_date_str, end_date_str, user_id=user_id)
+            resolution_by_prio_df = dashboard_data['resolution_by_priority']
         if not resolution_by_prio_df.empty:
             fig = px.bar(
                 resolution_by_prio_df,
@@ -254,7 +260,7 @@ if user_role == 'admin':
     with st.expander("Agent Performance", expanded=False):
         st.subheader("Agent Performance: Tickets Resolved")
         with st.spinner("Loading Agent Performance Metrics..."):
-            agent_perf_df = get_agent_performance_metrics(start_date_str, end_date_str, user_id=user_id)
+            agent_perf_df = dashboard_data['agent_performance']
         if not agent_perf_df.empty:
             fig = px.bar(
                 agent_perf_df,
@@ -304,7 +310,7 @@ with st.expander("Recurring Issues Analysis", expanded=False):
 with st.expander("Ticket Volume Trends", expanded=False):
     st.subheader("Tickets Created vs. Resolved Trend")
     with st.spinner("Loading Created vs. Resolved Trends..."):
-        created_resolved_df = get_created_vs_resolved_trends(start_date_str, end_date_str, user_id=user_id)
+        created_resolved_df = dashboard_data['created_vs_resolved']
     if not created_resolved_df.empty:
         fig = go.Figure()
         fig.add_trace(go.Scatter(
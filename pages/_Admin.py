@@ -8,7 +8,7 @@ from db.users import get_all_users, create_user, get_user, update_user_admin, de
 from db.tickets import get_tickets_for_reassignment, reassign_ticket, get_tickets, get_ticket_counts_by_category
 from db.categories_priorities import get_categories, add_category, update_category, archive_category, get_priorities, update_priority
 from db.sla_settings import get_sla_settings, update_sla_settings
-from db.system_settings import get_system_settings, update_system_setting
+from db.system_settings import get_system_settings, update_system_settings
 from db.activity_logs import get_distinct_activity_users, get_distinct_action_types, get_activity_logs
 
 st.set_page_config(
@@ -180,8 +180,7 @@ def display_user_management_tab():
         agent_workload.columns = ['Agent', 'Assigned Tickets']
 
         # Get all agents to include those with 0 tickets
-        all_agents_df = get_all_agents()
-        all_agent_names = all_agents_df['username'].tolist()
+        all_agent_names = [agent['username'] for agent in get_all_agents()]
 
         # Merge to ensure all agents are in the workload, filling 0 for unassigned
         full_workload_df = pd.DataFrame({'Agent': all_agent_names}).merge(
@@ -201,14 +200,14 @@ def display_user_management_tab():
     tickets_for_reassignment = get_tickets_for_reassignment() # Tickets not resolved/closed
     all_agents = get_all_agents()
 
-    if tickets_for_reassignment.empty:
+    if not tickets_for_reassignment:
         st.info("No tickets currently available for reassignment.")
-    elif all_agents.empty:
+    elif not all_agents:
         st.warning("No agents found to reassign tickets to.")
     else:
         # Prepare options for selectboxes
-        ticket_options = {f"#{ticket['id']} - {ticket['title']} (Assigned to: {ticket['agent_name'] or 'Unassigned'})": ticket['id'] for index, ticket in tickets_for_reassignment.iterrows()}
-        agent_options = {agent['username']: agent['id'] for index, agent in all_agents.iterrows()}
+        ticket_options = {f"#{ticket['id']} - {ticket['title']} (Assigned to: {ticket['agent_name'] or 'Unassigned'})": ticket['id'] for ticket in tickets_for_reassignment}
+        agent_options = {agent['username']: agent['id'] for agent in all_agents}
         agent_options["Unassign"] = None # Option to unassign a ticket
 
         with st.form("reassign_ticket_form"):
@@ -417,12 +416,14 @@ def display_email_settings_tab():
         submitted = st.form_submit_button("Save Email Settings")
 
         if submitted:
-            update_system_setting('email_enabled', str(email_enabled), admin_id)
-            update_system_setting('from_name', from_name, admin_id)
-            update_system_setting('from_email', from_email, admin_id)
-            update_system_setting('smtp_host', smtp_host, admin_id)
-            update_system_setting('smtp_port', str(smtp_port), admin_id)
-            update_system_setting('smtp_username', smtp_username, admin_id)
+            update_system_settings({
+                'email_enabled': str(email_enabled),
+                'from_name': from_name,
+                'from_email': from_email,
+                'smtp_host': smtp_host,
+                'smtp_port': str(smtp_port),
+                'smtp_username': smtp_username,
+            }, admin_id)
             st.success("Email settings saved successfully!")
 # --- Page Structure ---
 tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
@@ -555,15 +556,14 @@ def display_sla_configuration_tab():
 
         if business_hours_submitted:
             admin_id = st.session_state['user']['id']
-            # Save SLA calculation mode
-            update_system_setting('sla_calculation_mode', sla_calculation_mode, admin_id)
-            # Save working hours
-            update_system_setting('working_hour_start', working_hour_start.isoformat(), admin_id)
-            update_system_setting('working_hour_end', working_hour_end.isoformat(), admin_id)
-            # Save working days
-            update_system_setting('working_days', ','.join(selected_working_days), admin_id)
-            # Save timezone
-            update_system_setting('timezone', selected_timezone, admin_id)
+            # Save SLA calculation mode, working hours, working days and timezone
+            update_system_settings({
+                'sla_calculation_mode': sla_calculation_mode,
+                'working_hour_start': working_hour_start.isoformat(),
+                'working_hour_end': working_hour_end.isoformat(),
+                'working_days': ','.join(selected_working_days),
+                'timezone': selected_timezone,
+            }, admin_id)
 
             st.success("SLA settings updated successfully!")
 
@@ -597,8 +597,10 @@ def display_system_settings_tab():
         settings_submitted = st.form_submit_button("Save Ticket Settings")
 
         if settings_submitted:
-            update_system_setting('ticket_id_prefix', ticket_id_prefix, admin_id)
-            # update_system_setting('enable_attachments', str(enable_attachments), admin_id)
+            update_system_settings({
+                'ticket_id_prefix': ticket_id_prefix,
+                # 'enable_attachments': str(enable_attachments),
+            }, admin_id)
             st.success("Ticket settings updated successfully!")
 
     st.markdown("---")
@@ -630,9 +632,10 @@ def display_system_settings_tab():
         notification_settings_submitted = st.form_submit_button("Save Notification Settings")
 
         if notification_settings_submitted:
-            # Update each setting
-            update_system_setting('enable_email_notifications', str(enable_email_notifications), admin_id)
-            update_system_setting('notification_events', ','.join(selected_notification_events), admin_id)
+            update_system_settings({
+                'enable_email_notifications': str(enable_email_notifications),
+                'notification_events': ','.join(selected_notification_events),
+            }, admin_id)
             
             st.success("Notification settings updated successfully!")
 
@@ -643,9 +646,12 @@ with tab4:
 def display_activity_logs_tab():
     st.header("Activity Logs")
 
-    # Initialize pagination in session state
+    # Initialize pagination in session state. Page i starts after the
+    # (timestamp, id) key stored at index i; the first page has no key.
     if 'activity_log_current_page' not in st.session_state:
         st.session_state['activity_log_current_page'] = 0
+    if 'activity_log_page_keys' not in st.session_state:
+        st.session_state['activity_log_page_keys'] = [None]
 
     logs_per_page = 10
 
@@ -683,15 +689,24 @@ def display_activity_logs_tab():
     start_date_str = start_date.isoformat() if start_date else None
     end_date_str = end_date.isoformat() if end_date else None
 
+    # Page keys belong to one filter selection; start over at page 1 when
+    # the filters change (or the stored keys don't cover the current page).
+    current_filters = (start_date_str, end_date_str, filter_user_id, filter_action_type)
+    if (st.session_state.get('activity_log_filters') != current_filters or
+            st.session_state['activity_log_current_page'] >= len(st.session_state['activity_log_page_keys'])):
+        st.session_state['activity_log_filters'] = current_filters
+        st.session_state['activity_log_current_page'] = 0
+        st.session_state['activity_log_page_keys'] = [None]
+
     # Fetch logs for the current page
-    offset = st.session_state['activity_log_current_page'] * logs_per_page
+    page_keys = st.session_state['activity_log_page_keys']
     logs_df, total_logs = get_activity_logs(
         start_date=start_date_str,
         end_date=end_date_str,
         user_id=filter_user_id,
         action_type=filter_action_type,
         limit=logs_per_page,
-        offset=offset
+        before=page_keys[st.session_state['activity_log_current_page']]
     )
     
     if logs_df.empty:
@@ -708,9 +723,12 @@ def display_activity_logs_tab():
         with col_prev:
             if st.button("Previous Page", disabled=(st.session_state['activity_log_current_page'] == 0)):
                 st.session_state['activity_log_current_page'] -= 1
+                page_keys.pop()
                 st.rerun()
         with col_next:
             if st.button("Next Page", disabled=(st.session_state['activity_log_current_page'] >= total_pages - 1)):
+                last_row = logs_df.iloc[-1]
+                page_keys.append((last_row['timestamp'], int(last_row['id'])))
                 st.session_state['activity_log_current_page'] += 1
                 st.rerun()
 
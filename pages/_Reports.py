@@ -1,6 +1,6 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import io
 import plotly.express as px
 
@@ -43,14 +43,16 @@ with st.container(border=True):
 
     # Date Range
     st.markdown("##### Date Range")
+    # Ticket timestamps are stored in UTC, so the presets use the UTC date.
+    today = datetime.now(timezone.utc).date()
     date_presets = {
-        "Today": (datetime.now().date(), datetime.now().date()),
-        "This Week": (datetime.now().date() - timedelta(days=datetime.now().weekday()), datetime.now().date()),
-        "This Month": (datetime.now().date().replace(day=1), datetime.now().date()),
-        "Last Month": ((datetime.now().date().replace(day=1) - timedelta(days=1)).replace(day=1), (datetime.now().date().replace(day=1) - timedelta(days=1))),
-        "This Quarter": (datetime(datetime.now().year, (datetime.now().month - 1) // 3 * 3 + 1, 1).date(), datetime.now().date()),
-        "This Year": (datetime(datetime.now().year, 1, 1).date(), datetime.now().date()),
-        "Custom Range": (datetime.now().date() - timedelta(days=30), datetime.now().date())
+        "Today": (today, today),
+        "This Week": (today - timedelta(days=today.weekday()), today),
+        "This Month": (today.replace(day=1), today),
+        "Last Month": ((today.replace(day=1) - timedelta(days=1)).replace(day=1), (today.replace(day=1) - timedelta(days=1))),
+        "This Quarter": (today.replace(month=(today.month - 1) // 3 * 3 + 1, day=1), today),
+        "This Year": (today.replace(month=1, day=1), today),
+        "Custom Range": (today - timedelta(days=30), today)
     }
 
     preset_selection = st.selectbox("Date Range Presets", list(date_presets.keys()), index=6)
@@ -77,11 +79,9 @@ with st.container(border=True):
     user_role = st.session_state['user']['role']
     user_id = st.session_state['user']['id']
 
-    @st.cache_data
-    def load_filter_data(start, end, role, u_id):
-        return get_tickets_for_analytics(start, end, role, u_id)
-
-    all_tickets_df = load_filter_data(start_date_str, end_date_str, user_role, user_id)
+    # get_tickets_for_analytics caches per data version, so the filters
+    # follow ticket writes.
+    all_tickets_df = get_tickets_for_analytics(start_date_str, end_date_str, user_role, user_id)
 
     if all_tickets_df.empty:
         st.warning("No ticket data available for the selected date range to populate filters.")
@@ -180,7 +180,9 @@ if st.session_state.get('report_generated', False):
         if report_type == "Category Analysis" or report_type == "Agent Performance":
             st.markdown("#### Charts")
             if report_type == "Category Analysis" and 'category' in report_df.columns:
-                fig = px.bar(report_df['category'].value_counts(), title="Tickets per Category")
+                # category is categorical; leave out categories filtered away above
+                category_counts = report_df['category'].value_counts()
+                fig = px.bar(category_counts[category_counts > 0], title="Tickets per Category")
                 st.plotly_chart(fig)
             elif report_type == "Agent Performance" and 'agent_id' in report_df.columns:
                 fig = px.bar(report_df['agent_id'].value_counts(), title="Tickets per Agent")
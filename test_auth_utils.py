@@ -0,0 +1,28 @@
+import unittest
+import hashlib
+from auth_utils import hash_password, verify_password
+
+class TestVerifyPassword(unittest.TestCase):
+
+    def test_matching_password(self):
+        stored = hashlib.sha256("123".encode()).hexdigest()
+        self.assertTrue(verify_password("123", stored))
+
+    def test_wrong_password(self):
+        stored = hashlib.sha256("123".encode()).hexdigest()
+        self.assertFalse(verify_password("1234", stored))
+
+    def test_salted_hash(self):
+        stored = hash_password("123")
+        self.assertTrue(verify_password("123", stored))
+        self.assertFalse(verify_password("1234", stored))
+        self.assertNotEqual(stored, hash_password("123"))
+
+    def test_malformed_hash(self):
+        """ A stored value that is not hex must be rejected, not raise. """
+        self.assertFalse(verify_password("123", "not-a-hash"))
+        self.assertFalse(verify_password("123", None))
+        self.assertFalse(verify_password("123", "zz$zz"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,328 @@
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from auth_utils import verify_password
+from db import analytics_helpers, categories_priorities, system_settings, users
+from db.activity_logs import flush_activity_logs, get_activity_logs, log_activity
+from db.init import initialize_database
+from db.materialized import ROLLUP_TABLE
+from db.pool import _close_pool, pooled_connection
+from db.tickets import create_ticket, create_tickets_bulk, update_ticket, delete_ticket
+from db.users import create_user, create_users_bulk
+
+def _clear_process_caches():
+    analytics_helpers._rollup_exists = False
+    for cached in (analytics_helpers._cached_read_sql, analytics_helpers._counts_by_category,
+                   analytics_helpers._counts_by_priority, analytics_helpers._trends,
+                   system_settings._get_system_settings_cached):
+        cached.cache_clear()
+    categories_priorities._clear_caches()
+    users._clear_user_caches()
+
+class TempDatabaseTestCase(unittest.TestCase):
+    """ Runs each test against a fresh suppocket.db in a temporary directory. """
+
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp.name)
+        _close_pool()
+        _clear_process_caches()
+        initialize_database()
+
+        # No mail is sent from tests.
+        for name in ('send_ticket_created_notification', 'send_ticket_assigned_notification',
+                     'send_ticket_resolved_notification'):
+            patcher = mock.patch(f'db.tickets.{name}')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        flush_activity_logs()
+        _close_pool()
+        _clear_process_caches()
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+
+    def execute(self, query, params=()):
+        with pooled_connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+            conn.commit()
+            return rows
+
+class TestTicketRollup(TempDatabaseTestCase):
+    """ The roll-up queries must agree with the same aggregates over tickets. """
+
+    START, END = '2000-01-01', '2100-01-01'
+
+    def setUp(self):
+        super().setUp()
+        self.customer_id = create_user('customer', 'customer@example.com', 'secret')
+        self.rng = random.Random(1234)
+
+    def _create_tickets(self, count):
+        categories = ['Technical', 'Billing', 'Bug Report']
+        priorities = ['Low', 'High', 'Critical', None]
+        return [
+            create_ticket(f'Ticket {i}', 'Description', self.customer_id,
+                          self.rng.choice(categories), self.rng.choice(priorities))
+            for i in range(count)
+        ]
+
+    def _spread_over_days(self, ticket_ids):
+        """ Moves tickets to earlier days so the roll-up has several buckets. """
+        for ticket_id in ticket_ids:
+            days = self.rng.randint(0, 60)
+            hours = self.rng.randint(1, 72)
+            self.execute(
+                """
+                UPDATE tickets SET
+                    created_at = DATETIME(created_at, ?),
+                    resolved_at = DATETIME(resolved_at, ?)
+                WHERE id = ?
+                """,
+                (f'-{days + 3} days', f'-{days} days', ticket_id)
+            )
+            if hours % 3 == 0:
+                self.execute(
+                    "UPDATE tickets SET resolved_at = DATETIME(resolved_at, ?) WHERE id = ?",
+                    (f'+{hours} hours', ticket_id)
+                )
+
+    def _rollup_row_count(self):
+        return self.execute(f"SELECT COUNT(*) FROM {ROLLUP_TABLE}")[0][0]
+
+    def _assert_same(self, rollup_query, tickets_query, params, key):
+        expected = analytics_helpers._execute_df_small(tickets_query, params)
+        actual = analytics_helpers._execute_df_small(rollup_query, params)
+        expected = expected.sort_values(key, na_position='first').reset_index(drop=True)
+        actual = actual.sort_values(key, na_position='first').reset_index(drop=True)
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+    def _assert_rollup_matches_tickets(self):
+        period = (self.START, self.END)
+        self._assert_same(analytics_helpers.Q_COUNTS_BY_CATEGORY,
+                          analytics_helpers.Q_COUNTS_BY_CATEGORY_TICKETS, period, 'category')
+        self._assert_same(analytics_helpers.Q_COUNTS_BY_PRIORITY,
+                          analytics_helpers.Q_COUNTS_BY_PRIORITY_TICKETS, period, 'priority')
+        for grouping in analytics_helpers.GROUP_FORMATS:
+            self._assert_same(analytics_helpers.Q_TRENDS[grouping],
+                              analytics_helpers.Q_TRENDS_TICKETS[grouping], period, 'date')
+            self._assert_created_vs_resolved(grouping)
+        for group_column in ('category', 'priority'):
+            self._assert_same(analytics_helpers.Q_RESOLUTION_TIME[(group_column, None)],
+                              analytics_helpers.Q_RESOLUTION_TIME_TICKETS[group_column],
+                              period, group_column)
+        self.assertAlmostEqual(
+            analytics_helpers._execute_scalar(analytics_helpers.Q_AVERAGE_RESOLUTION_TIME, period),
+            analytics_helpers._execute_scalar(analytics_helpers.Q_AVERAGE_RESOLUTION_TIME_TICKETS, period)
+        )
+
+    def _assert_created_vs_resolved(self, grouping):
+        period = (self.START, self.END)
+        expected = analytics_helpers._execute_df_small(
+            analytics_helpers.Q_CREATED_VS_RESOLVED_TICKETS[grouping], period * 2)
+        actual = analytics_helpers._execute_df_small(
+            analytics_helpers.Q_CREATED_VS_RESOLVED[(grouping, None)], period)
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+    def test_rollup_matches_tickets_queries(self):
+        ticket_ids = self._create_tickets(40)
+        for ticket_id in ticket_ids[::2]:
+            update_ticket(ticket_id, self.customer_id, status='Resolved')
+        for ticket_id in ticket_ids[1::5]:
+            update_ticket(ticket_id, self.customer_id, category='Billing', priority='Medium')
+        for ticket_id in ticket_ids[::4]:
+            update_ticket(ticket_id, self.customer_id, status='Closed')
+        self._spread_over_days(ticket_ids)
+        for ticket_id in ticket_ids[::7]:
+            delete_ticket(ticket_id, self.customer_id)
+        self._assert_rollup_matches_tickets()
+
+        # Recategorising resolved tickets moves their resolution hours too.
+        for ticket_id in ticket_ids[2::6]:
+            update_ticket(ticket_id, self.customer_id, category='Technical', priority='Low')
+        self._assert_rollup_matches_tickets()
+
+    def test_null_keys_do_not_grow_rollup(self):
+        ticket_id = create_ticket('No priority', 'Description', self.customer_id, 'Technical', None)
+        update_ticket(ticket_id, self.customer_id, status='Resolved')
+        rows = self._rollup_row_count()
+        for status in ('In Progress', 'Resolved', 'Open', 'Closed') * 3:
+            update_ticket(ticket_id, self.customer_id, status=status)
+        self.assertEqual(self._rollup_row_count(), rows)
+        self._assert_rollup_matches_tickets()
+
+class TestAnalyticsCache(TempDatabaseTestCase):
+    """ Writes must show up in cached analytics results without a cache clear. """
+
+    START, END = '2000-01-01', '2100-01-01'
+
+    def setUp(self):
+        super().setUp()
+        self.customer_id = create_user('customer', 'customer@example.com', 'secret')
+        self.agent_id = create_user('agent', 'agent@example.com', 'secret', role='agent')
+        self.ticket_id = create_ticket('First', 'Description', self.customer_id, 'Technical', 'Low')
+        update_ticket(self.ticket_id, self.customer_id, agent_id=self.agent_id)
+
+    def test_ticket_write_changes_tickets_for_analytics(self):
+        before = analytics_helpers.get_tickets_for_analytics(self.START, self.END)
+        update_ticket(self.ticket_id, self.customer_id, status='Resolved')
+        after_update = analytics_helpers.get_tickets_for_analytics(self.START, self.END)
+        self.assertEqual(list(before['status']), ['Open'])
+        self.assertEqual(list(after_update['status']), ['Resolved'])
+
+        create_ticket('Second', 'Description', self.customer_id, 'Billing', 'High')
+        self.assertEqual(len(analytics_helpers.get_tickets_for_analytics(self.START, self.END)), 2)
+
+        # Writes from outside the db helpers (another connection) count too.
+        self.execute("DELETE FROM tickets WHERE id = ?", (self.ticket_id,))
+        after_delete = analytics_helpers.get_tickets_for_analytics(self.START, self.END)
+        self.assertEqual(list(after_delete['title']), ['Second'])
+
+    def test_username_update_changes_agent_names(self):
+        before = analytics_helpers.get_agent_performance_metrics(self.START, self.END)
+        self.assertEqual(list(before['agent_name']), ['agent'])
+        users.update_user(self.agent_id, 'renamed agent', 'agent@example.com')
+        after = analytics_helpers.get_agent_performance_metrics(self.START, self.END)
+        self.assertEqual(list(after['agent_name']), ['renamed agent'])
+
+class TestStatusBreakdown(TempDatabaseTestCase):
+
+    START, END = '2000-01-01', '2100-01-01'
+
+    def test_missing_priority_can_be_selected(self):
+        customer_id = create_user('customer', 'customer@example.com', 'secret')
+        create_ticket('With priority', 'Description', customer_id, 'Technical', 'Low')
+        create_ticket('Without priority', 'Description', customer_id, 'Technical', None)
+        tickets_df = analytics_helpers.get_tickets_for_analytics(self.START, self.END)
+        priorities = tuple(tickets_df['priority'].unique().tolist())
+
+        from_sql = analytics_helpers.get_status_breakdown_per_category(
+            start_date=self.START, end_date=self.END, categories=('Technical',),
+            priorities=priorities, statuses=('Open',)
+        )
+        self.assertEqual(from_sql['count'].tolist(), [2])
+        from_df = analytics_helpers.get_status_breakdown_per_category(df=tickets_df)
+        self.assertEqual(from_df['count'].tolist(), [2])
+
+        only_missing = analytics_helpers.get_status_breakdown_per_category(
+            start_date=self.START, end_date=self.END, priorities=(float('nan'),)
+        )
+        self.assertEqual(only_missing['count'].tolist(), [1])
+
+class TestActivityLogs(TempDatabaseTestCase):
+
+    def _stored_actions(self):
+        return [row[0] for row in self.execute("SELECT action_type FROM activity_logs ORDER BY id")]
+
+    def test_flush_makes_queued_entries_visible(self):
+        for i in range(5):
+            log_activity(None, f"action_{i}", "tests", i)
+        flush_activity_logs()
+        self.assertEqual(self._stored_actions(), [f"action_{i}" for i in range(5)])
+
+        logs, total = get_activity_logs(action_type="action_3")
+        self.assertEqual(total, 1)
+        self.assertEqual(list(logs['resource_id']), [3])
+
+    def test_durable_entry_is_written_before_returning(self):
+        log_activity(None, "queued", "tests")
+        log_activity(None, "audited", "tests", durable=True)
+        # Entries queued earlier are written first, keeping their order.
+        self.assertEqual(self._stored_actions(), ["queued", "audited"])
+
+class TestActivityLogPagination(TempDatabaseTestCase):
+    """ Keyset pages of the activity log, as walked by the Admin page. """
+
+    def setUp(self):
+        super().setUp()
+        # 25 entries over three timestamps; the 10-row page edges fall
+        # inside runs of equal timestamps.
+        timestamps = ['2024-01-01 09:00:00'] * 4 + ['2024-01-01 10:00:00'] * 14 + ['2024-01-01 11:00:00'] * 7
+        self.execute("DELETE FROM activity_logs")
+        for i, timestamp in enumerate(timestamps):
+            self.execute(
+                "INSERT INTO activity_logs (user_id, action_type, resource_type, resource_id, details, timestamp) "
+                "VALUES (NULL, ?, 'tests', ?, '', ?)",
+                ('even' if i % 2 == 0 else 'odd', i, timestamp)
+            )
+        self.expected_ids = [row[0] for row in self.execute(
+            "SELECT id FROM activity_logs ORDER BY timestamp DESC, id DESC")]
+
+    def test_pages_cover_each_entry_once(self):
+        seen_ids = []
+        before = None
+        while True:
+            logs_df, total = get_activity_logs(limit=10, before=before)
+            self.assertEqual(total, 25)
+            if logs_df.empty:
+                break
+            seen_ids.extend(int(i) for i in logs_df['id'])
+            last_row = logs_df.iloc[-1]
+            before = (last_row['timestamp'], int(last_row['id']))
+        self.assertEqual(seen_ids, self.expected_ids)
+
+    def test_filter_change_resets_to_first_page(self):
+        from streamlit.testing.v1 import AppTest
+
+        page_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages', '_Admin.py')
+        with mock.patch('auth_utils.render_sidebar'):
+            at = AppTest.from_file(page_path, default_timeout=30)
+            at.session_state['authenticated'] = True
+            at.session_state['user'] = {'id': 1, 'username': 'admin', 'role': 'admin', 'email': 'admin@example.com'}
+            at.run()
+            next(b for b in at.button if b.label == "Next Page").click().run()
+            self.assertEqual(at.session_state['activity_log_current_page'], 1)
+            self.assertEqual(len(at.session_state['activity_log_page_keys']), 2)
+
+            at.selectbox(key="log_action_type_filter").select('odd').run()
+        self.assertFalse(at.exception)
+        self.assertEqual(at.session_state['activity_log_current_page'], 0)
+        self.assertEqual(at.session_state['activity_log_page_keys'], [None])
+        self.assertIn("Page 1 of 2 (Total Logs: 12)", [m.value for m in at.markdown])
+
+class TestBulkCreation(TempDatabaseTestCase):
+
+    def _count(self, table):
+        return self.execute(f"SELECT COUNT(*) FROM {table}")[0][0]
+
+    def test_users_bulk_is_all_or_nothing(self):
+        users_before = self._count('users')
+        self.assertEqual(create_users_bulk([
+            ('alice', 'alice@example.com', 'secret', 'customer', 'active'),
+            ('bob', 'bob@example.com', 'secret', 'agent', 'active'),
+        ]), 2)
+        self.assertTrue(verify_password('secret', users.get_user(username='alice')['password_hash']))
+
+        # The second row reuses alice's email, so neither row is written.
+        self.assertIsNone(create_users_bulk([
+            ('carol', 'carol@example.com', 'secret', 'customer', 'active'),
+            ('alice2', 'alice@example.com', 'secret', 'customer', 'active'),
+        ]))
+        self.assertEqual(self._count('users'), users_before + 2)
+        self.assertEqual(create_users_bulk([]), 0)
+
+    def test_tickets_bulk_validates_every_row(self):
+        customer_id = create_user('customer', 'customer@example.com', 'secret')
+        self.assertEqual(create_tickets_bulk([
+            ('First', 'Description', customer_id, 'Technical', 'Low'),
+            ('Second', 'Description', customer_id, 'Billing', None),
+        ]), 2)
+        self.assertIsNone(create_tickets_bulk([
+            ('Third', 'Description', customer_id, 'Technical', 'Low'),
+            ('Fourth', 'Description', customer_id, 'No such category', 'Low'),
+        ]))
+        self.assertIsNone(create_tickets_bulk([
+            ('Fifth', 'Description', customer_id + 100, 'Technical', 'Low'),
+        ]))
+        titles = [row[0] for row in self.execute("SELECT title FROM tickets ORDER BY id")]
+        self.assertEqual(titles, ['First', 'Second'])
+
+if __name__ == '__main__':
+    unittest.main()